@@ -0,0 +1,57 @@
+-- One row per table loaded into customers: every load of a table takes
+-- a new load_id, in the load's own transaction, so a failed load leaves
+-- the mark as it was. Steps that keep state derived from customers
+-- (Day1/ex02/remove_duplicates_incremental.sql, Day2/sketches.py)
+-- record the load_id they last processed and redo the rows of a table
+-- whose load_id moved; customers_loads() lists the tables with their
+-- current mark.
+-- Loaders: SELECT mark_load('data_2022_oct');
+-- customers_price_col() names the price column of customers for the
+-- steps that query it with dynamic SQL.
+
+CREATE SEQUENCE IF NOT EXISTS load_marks_seq;
+
+CREATE TABLE IF NOT EXISTS load_marks (
+    table_name TEXT PRIMARY KEY,
+    load_id BIGINT NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION mark_load(loaded regclass)
+RETURNS bigint AS $$
+    INSERT INTO load_marks (table_name, load_id)
+    VALUES (loaded::text, nextval('load_marks_seq'))
+    ON CONFLICT (table_name) DO UPDATE SET
+        load_id = EXCLUDED.load_id,
+        loaded_at = now()
+    RETURNING load_id
+$$ LANGUAGE sql;
+
+-- the relations customers reads rows from, itself or its partitions,
+-- with their current load mark (NULL for a table never marked)
+CREATE OR REPLACE FUNCTION customers_loads()
+RETURNS TABLE (rel regclass, load_id bigint) AS $$
+    SELECT r.oid::regclass, m.load_id
+    FROM (
+        SELECT c.oid
+        FROM pg_partition_tree('customers') p
+        JOIN pg_class c ON c.oid = p.relid
+        WHERE c.relkind = 'r'
+        UNION ALL
+        -- pg_partition_tree() has no rows for a plain table
+        SELECT c.oid
+        FROM pg_class c
+        WHERE c.oid = 'customers'::regclass AND c.relkind = 'r'
+    ) r
+    LEFT JOIN load_marks m ON m.table_name = r.oid::regclass::text
+$$ LANGUAGE sql STABLE;
+
+-- customers carries the price as event_price after Day1/ex03/fusion.sql
+-- and as price when it is the partitioned table of Day1/ex01
+CREATE OR REPLACE FUNCTION customers_price_col()
+RETURNS text AS $$
+    SELECT column_name::text
+    FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = 'customers'
+      AND column_name IN ('event_price', 'price')
+$$ LANGUAGE sql STABLE;
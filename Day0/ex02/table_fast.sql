@@ -0,0 +1,79 @@
+-- Same table as table.sql, loaded through the bulk-load fast path:
+-- UNLOGGED staging table, made LOGGED after the COPY, indexes built
+-- once, analyzed and swapped into place. \timing prints each phase.
+-- A month attached to the partitioned customers (Day1/ex01) is
+-- detached for the swap and the new table attached with its bounds.
+-- DETACH locks customers until COMMIT, so a CHECK matching the bounds
+-- is validated beforehand and ATTACH does not scan the month again.
+
+\timing on
+
+\ir load_marks.sql
+
+BEGIN;
+
+DROP TABLE IF EXISTS data_2022_oct_staging;
+
+CREATE UNLOGGED TABLE data_2022_oct_staging (
+    event_time TIMESTAMPTZ,
+    event_type VARCHAR(20),
+    product_id INTEGER,
+    price NUMERIC(10,2),
+    user_id BIGINT,
+    user_session UUID
+);
+
+-- copy
+\copy data_2022_oct_staging FROM './data_2022_oct.csv' DELIMITER ',' CSV HEADER;
+
+-- event_type is stored lower-case, as the other load paths do
+UPDATE data_2022_oct_staging SET event_type = lower(event_type)
+WHERE event_type <> lower(event_type);
+
+-- logged (SET LOGGED rewrites the table and its indexes, so it goes first)
+ALTER TABLE data_2022_oct_staging SET LOGGED;
+
+-- index
+SET LOCAL maintenance_work_mem = '512MB';
+CREATE INDEX data_2022_oct_staging_product_id_idx ON data_2022_oct_staging (product_id);
+CREATE INDEX data_2022_oct_staging_user_id_idx ON data_2022_oct_staging (user_id);
+CREATE INDEX data_2022_oct_staging_event_time_idx ON data_2022_oct_staging (event_time);
+
+-- analyze
+ANALYZE data_2022_oct_staging;
+
+-- check
+SELECT p.parent IS NOT NULL AS attached,
+       coalesce(p.parent, '') AS parent,
+       coalesce(p.bound, '') AS bound,
+       coalesce(p.bounds_check, '') AS bounds_check
+FROM (SELECT 1) one
+LEFT JOIN (
+    SELECT i.inhparent::regclass::text AS parent, pg_get_expr(c.relpartbound, c.oid) AS bound,
+           pg_get_partition_constraintdef(c.oid) AS bounds_check
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhrelid = to_regclass('data_2022_oct') AND c.relispartition
+) p ON true \gset
+
+\if :attached
+ALTER TABLE data_2022_oct_staging ADD CONSTRAINT data_2022_oct_bounds CHECK (:bounds_check);
+\endif
+
+-- swap
+\if :attached
+ALTER TABLE :parent DETACH PARTITION data_2022_oct;
+\endif
+DROP TABLE IF EXISTS data_2022_oct;
+ALTER TABLE data_2022_oct_staging RENAME TO data_2022_oct;
+ALTER INDEX data_2022_oct_staging_product_id_idx RENAME TO data_2022_oct_product_id_idx;
+ALTER INDEX data_2022_oct_staging_user_id_idx RENAME TO data_2022_oct_user_id_idx;
+ALTER INDEX data_2022_oct_staging_event_time_idx RENAME TO data_2022_oct_event_time_idx;
+\if :attached
+ALTER TABLE :parent ATTACH PARTITION data_2022_oct :bound;
+ALTER TABLE data_2022_oct DROP CONSTRAINT data_2022_oct_bounds;
+\endif
+
+SELECT mark_load('data_2022_oct');
+
+COMMIT;
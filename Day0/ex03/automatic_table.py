@@ -1,24 +1,21 @@
-import psycopg2
-import pandas as pd
+import argparse
+import hashlib
+import io
 import os
-import uuid
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def safe_uuid(value):
-	"""
-	Convert a value to a valid UUID or return None.
-	"""
-	try:
-		return uuid.UUID(str(value))
-	except Exception:
-		return None
+import pandas as pd
+import psycopg2
+
+import binary_copy
 
-conn = psycopg2.connect(
+DB = dict(
 	dbname="piscineds",
 	user="gtskitis",
 	password="mysecretpassword",
 	host="localhost"
 )
-cur = conn.cursor()
 
 # fixed schema
 columns = {
@@ -32,43 +29,467 @@ columns = {
 
 folder = "./customer"
 
-import io
+# bytes handed to the server per COPY round trip in stream mode
+COPY_BLOCK = 1 << 20
+
+# one row per source file: what it looked like when its table was built
+MANIFEST = "load_manifest"
+
+# load_marks and mark_load(): a new load_id per table on every load
+LOAD_MARKS_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ex02", "load_marks.sql")
+
+# fast path: columns indexed once the data is in, and the memory the build may use
+INDEXED = ["product_id", "user_id", "event_time"]
+INDEX_MEM = "512MB"
+
+# binary mode: rows validated and encoded per chunk, bad rows kept here
+BINARY_CHUNK = 500_000
+rejects_folder = "./rejects"
+
+
+def create_table(cur, table_name, unlogged=False):
+	"""Drop and recreate a monthly table with the fixed schema."""
+	cols = ",\n\t\t".join(f"{name:<12} {kind}" for name, kind in columns.items())
+	cur.execute(f"DROP TABLE IF EXISTS {table_name};")
+	cur.execute(f"CREATE {'UNLOGGED ' if unlogged else ''}TABLE {table_name} (\n\t\t{cols}\n\t);")
+
+
+def partition_of(cur, table_name):
+	"""
+	(parent, bound, constraint) when the table is attached as a
+	partition, as the months are under the partitioned customers
+	(Day1/ex01), else None. constraint is the bound as a CHECK expression.
+	"""
+	cur.execute("""
+		SELECT i.inhparent::regclass::text, pg_get_expr(c.relpartbound, c.oid),
+		       pg_get_partition_constraintdef(c.oid)
+		FROM pg_inherits i
+		JOIN pg_class c ON c.oid = i.inhrelid
+		WHERE i.inhrelid = to_regclass(%s) AND c.relispartition;
+	""", (table_name,))
+	return cur.fetchone()
+
+
+def missing_indexes(cur, parent, table_name):
+	"""
+	[(unique, using)] for the partitioned indexes of parent that
+	table_name has no equivalent of, using being the definition from
+	" USING" on; ATTACH would build these while it holds the lock.
+	"""
+	cur.execute("""
+		SELECT i.indisunique, substring(pg_get_indexdef(i.indexrelid) FROM ' USING .*$')
+		FROM pg_index i
+		WHERE i.indrelid = to_regclass(%s)
+		  AND substring(pg_get_indexdef(i.indexrelid) FROM ' USING .*$') NOT IN (
+			SELECT substring(pg_get_indexdef(t.indexrelid) FROM ' USING .*$')
+			FROM pg_index t
+			WHERE t.indrelid = to_regclass(%s))
+		ORDER BY i.indexrelid;
+	""", (parent, table_name))
+	return cur.fetchall()
+
+
+def reset_table(cur, table_name):
+	"""
+	Empty a monthly table before reloading it. An attached partition is
+	truncated in place, since dropping it would take the month out of
+	customers; any other table is dropped and recreated.
+	"""
+	if partition_of(cur, table_name):
+		cur.execute(f"TRUNCATE {table_name};")
+	else:
+		create_table(cur, table_name)
+
+
+def copy_frame(cur, df, table_name):
+	"""Serialize one DataFrame to an in-memory CSV and COPY it into the table."""
+	# event_type is stored lower-case so queries can filter on it without lower()
+	df = df.assign(event_type=df["event_type"].str.lower())
+
+	# Clean dataframe (replace NaN with \N for NULLs)
+	df = df.where(pd.notnull(df), None)
+
+	# Write CSV content to memory buffer
+	buffer = io.StringIO()
+	df.to_csv(buffer, index=False, header=False)
+	buffer.seek(0)
+
+	# Bulk copy directly into Postgres
+	cur.copy_from(buffer, table_name, sep=",", null="")
+	return len(df)
+
+
+def load_pandas(cur, csv_path, table_name, chunksize=None):
+	"""
+	Load a CSV through pandas.
+	Without chunksize the whole month is read at once; with it, memory is
+	bounded by one chunk and its CSV buffer.
+	"""
+	if not chunksize:
+		return copy_frame(cur, pd.read_csv(csv_path), table_name)
+	rows = 0
+	for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+		rows += copy_frame(cur, chunk, table_name)
+	return rows
+
+
+def load_stream(cur, csv_path, table_name):
+	"""
+	Pass the file straight through to COPY ... FROM STDIN.
+	psycopg2 reads it in COPY_BLOCK pieces, so memory stays flat
+	whatever the file size and the server does the parsing.
+	"""
+	with open(csv_path, "r") as f:
+		cur.copy_expert(
+			f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+			f,
+			size=COPY_BLOCK,
+		)
+	rows = cur.rowcount
+	# the server saw the raw text, so normalize event_type case afterwards
+	cur.execute(f"UPDATE {table_name} SET event_type = lower(event_type) "
+				"WHERE event_type <> lower(event_type);")
+	return rows
+
+
+def load_binary(cur, csv_path, table_name, chunksize=None):
+	"""
+	Validate and convert each chunk once, vectorized, and send it as
+	COPY BINARY: no text re-encoding, and a malformed UUID or timestamp,
+	or a line with the wrong number of fields, goes to rejects/<table>.csv
+	instead of aborting the whole month. Empty fields load as NULL, as in
+	the other modes.
+	"""
+	reject_path = os.path.join(rejects_folder, f"{table_name}.csv")
+	if os.path.exists(reject_path):
+		os.remove(reject_path)
+	sql = (f"COPY {table_name} ({', '.join(binary_copy.COPY_COLUMNS)}) "
+		   "FROM STDIN WITH (FORMAT binary)")
+
+	bad_lines = []
+	rejected = 0
+
+	def keep(rejects):
+		nonlocal rejected
+		if bad_lines:
+			rejects = pd.concat([binary_copy.malformed(bad_lines), rejects], ignore_index=True)
+			bad_lines.clear()
+		if len(rejects):
+			os.makedirs(rejects_folder, exist_ok=True)
+			rejects.to_csv(reject_path, mode="a", index=False,
+						   header=not os.path.exists(reject_path))
+			rejected += len(rejects)
+
+	rows = 0
+	for chunk in binary_copy.read_chunks(csv_path, chunksize or BINARY_CHUNK,
+										 lambda row: bad_lines.append(row.text)):
+		typed, rejects = binary_copy.validate(chunk)
+		if len(typed):
+			payload = binary_copy.HEADER + binary_copy.encode(typed) + binary_copy.TRAILER
+			cur.copy_expert(sql, io.BytesIO(payload), size=COPY_BLOCK)
+			rows += len(typed)
+		keep(rejects)
+	# bad lines after the last row
+	keep(binary_copy.malformed([]))
+
+	if rejected:
+		print(f"    {rejected:,} rejected rows -> {reject_path}")
+	return rows
+
+
+def file_hash(csv_path):
+	"""sha256 of the file contents, read in COPY_BLOCK pieces."""
+	digest = hashlib.sha256()
+	with open(csv_path, "rb") as f:
+		for block in iter(lambda: f.read(COPY_BLOCK), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+def fingerprint(csv_path, content_hash=None):
+	"""(size, mtime, hash) of a source file; the hash is computed only if not given."""
+	st = os.stat(csv_path)
+	return st.st_size, int(st.st_mtime), content_hash or file_hash(csv_path)
+
+
+def ensure_manifest(conn):
+	with conn.cursor() as cur:
+		cur.execute(f"""
+		CREATE TABLE IF NOT EXISTS {MANIFEST} (
+			table_name   TEXT PRIMARY KEY,
+			file_name    TEXT NOT NULL,
+			file_size    BIGINT NOT NULL,
+			file_mtime   BIGINT NOT NULL,
+			content_hash TEXT NOT NULL,
+			row_count    BIGINT NOT NULL,
+			loaded_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+		);
+		""")
+		with open(LOAD_MARKS_SQL) as f:
+			cur.execute(f.read())
+	conn.commit()
+
+
+def record_load(cur, csv_path, table_name, rows, fp):
+	"""Upsert the manifest row; runs inside the load's own transaction."""
+	size, mtime, content_hash = fp
+	cur.execute(f"""
+		INSERT INTO {MANIFEST} (table_name, file_name, file_size, file_mtime, content_hash, row_count)
+		VALUES (%s, %s, %s, %s, %s, %s)
+		ON CONFLICT (table_name) DO UPDATE SET
+			file_name = EXCLUDED.file_name,
+			file_size = EXCLUDED.file_size,
+			file_mtime = EXCLUDED.file_mtime,
+			content_hash = EXCLUDED.content_hash,
+			row_count = EXCLUDED.row_count,
+			loaded_at = now();
+	""", (table_name, os.path.basename(csv_path), size, mtime, content_hash, rows))
+
+
+def pending_files(conn, files):
+	"""
+	Keep only files whose size or mtime changed since their table was
+	built; none is read here. Returns [(csv_path, table_name, seen)],
+	seen being the manifest's (size, hash) for the table or None: the
+	worker loading the file hashes it and skips it if that still matches.
+	"""
+	with conn.cursor() as cur:
+		cur.execute(f"""
+			SELECT m.table_name, m.file_size, m.file_mtime, m.content_hash
+			FROM {MANIFEST} m
+			WHERE to_regclass(m.table_name) IS NOT NULL;
+		""")
+		known = {name: (size, mtime, digest) for name, size, mtime, digest in cur.fetchall()}
+
+	pending = []
+	for csv_path, table_name in files:
+		st = os.stat(csv_path)
+		seen = known.get(table_name)
+		if seen and seen[:2] == (st.st_size, int(st.st_mtime)):
+			print(f"Skipping {csv_path} (unchanged)")
+			continue
+		pending.append((csv_path, table_name, (seen[0], seen[2]) if seen else None))
+	return pending
+
+
+def copy_into(cur, csv_path, table_name, mode, chunksize):
+	if mode == "stream":
+		return load_stream(cur, csv_path, table_name)
+	if mode == "binary":
+		return load_binary(cur, csv_path, table_name, chunksize)
+	return load_pandas(cur, csv_path, table_name, chunksize)
+
+
+def load_fast(cur, csv_path, table_name, mode, chunksize):
+	"""
+	High-throughput path: COPY into an UNLOGGED staging table with no
+	indexes, make it LOGGED, build the indexes once, ANALYZE it and swap
+	it in place of the old table. Readers of the table see the old one
+	until commit. A month attached to customers stays attached, but
+	DETACH locks customers (ACCESS EXCLUSIVE) until commit, so queries on
+	customers wait from the swap on. The staging table gets the indexes
+	of customers (Day2/indexes.sql, Day2/rollups.sql) before it, so
+	ATTACH only links them, and a CHECK matching the bounds lets ATTACH
+	skip its validation scan.
+	Returns (rows, {phase: seconds}).
+	"""
+	staging = f"{table_name}_staging"
+	phases = {}
+
+	def phase(name, since):
+		now = time.perf_counter()
+		phases[name] = now - since
+		return now
+
+	t = time.perf_counter()
+	create_table(cur, staging, unlogged=True)
+	rows = copy_into(cur, csv_path, staging, mode, chunksize)
+	t = phase("copy", t)
+
+	# SET LOGGED rewrites the table and every index on it, so it runs
+	# before the indexes exist and each one is built only once
+	cur.execute(f"ALTER TABLE {staging} SET LOGGED;")
+	t = phase("logged", t)
+
+	cur.execute(f"SET LOCAL maintenance_work_mem = '{INDEX_MEM}';")
+	for col in INDEXED:
+		cur.execute(f"DROP INDEX IF EXISTS {staging}_{col}_idx;")
+		cur.execute(f"CREATE INDEX {staging}_{col}_idx ON {staging} ({col});")
+	# an attached month is detached for the swap and the new table attached
+	# with the same bounds; the parent's indexes are built here, not by ATTACH
+	attached = partition_of(cur, table_name)
+	inherited = missing_indexes(cur, attached[0], staging) if attached else []
+	for n, (unique, using) in enumerate(inherited):
+		cur.execute(f"DROP INDEX IF EXISTS {staging}_parent{n}_idx;")
+		cur.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {staging}_parent{n}_idx ON {staging}{using};")
+	t = phase("index", t)
+
+	cur.execute(f"ANALYZE {staging};")
+	t = phase("analyze", t)
+
+	# the CHECK is validated here, on the staging table alone, so ATTACH
+	# need not scan it under the lock on customers
+	if attached:
+		cur.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_bounds CHECK ({attached[2]});")
+		t = phase("check", t)
+		cur.execute(f"ALTER TABLE {attached[0]} DETACH PARTITION {table_name};")
+	cur.execute(f"DROP TABLE IF EXISTS {table_name};")
+	cur.execute(f"ALTER TABLE {staging} RENAME TO {table_name};")
+	for col in INDEXED:
+		cur.execute(f"ALTER INDEX {staging}_{col}_idx RENAME TO {table_name}_{col}_idx;")
+	for n in range(len(inherited)):
+		cur.execute(f"ALTER INDEX {staging}_parent{n}_idx RENAME TO {table_name}_parent{n}_idx;")
+	if attached:
+		cur.execute(f"ALTER TABLE {attached[0]} ATTACH PARTITION {table_name} {attached[1]};")
+		# redundant once attached, as in attach_month()
+		cur.execute(f"ALTER TABLE {table_name} DROP CONSTRAINT {staging}_bounds;")
+	phase("swap", t)
+	return rows, phases
+
+
+def load_file(conn, csv_path, table_name, mode="pandas", chunksize=None,
+			  incremental=False, seen=None, fast=False):
+	"""
+	Recreate one table from one CSV in a single transaction; return
+	(rows, seconds, phases), phases being None outside the fast path.
+	With incremental, the file is fingerprinted first: if its size and
+	hash still match seen (from pending_files) only its mtime is updated
+	and None is returned. The table's load mark and manifest row are
+	written in the same transaction, so a failed load never marks the
+	file as done; without incremental the manifest row is dropped, as
+	nothing vouches for it any more.
+	"""
+	start = time.perf_counter()
+	phases = None
+	fp = fingerprint(csv_path) if incremental else None
+	if fp and seen == (fp[0], fp[2]):
+		print(f"Skipping {csv_path} (touched, same content)")
+		with conn.cursor() as cur:
+			cur.execute(f"UPDATE {MANIFEST} SET file_mtime = %s WHERE table_name = %s;",
+						(fp[1], table_name))
+		conn.commit()
+		return None
+	with conn.cursor() as cur:
+		if fast:
+			rows, phases = load_fast(cur, csv_path, table_name, mode, chunksize)
+		else:
+			reset_table(cur, table_name)
+			rows = copy_into(cur, csv_path, table_name, mode, chunksize)
+		cur.execute("SELECT mark_load(%s);", (table_name,))
+		if fp:
+			record_load(cur, csv_path, table_name, rows, fp)
+		else:
+			cur.execute(f"DELETE FROM {MANIFEST} WHERE table_name = %s;", (table_name,))
+	conn.commit()
+	return rows, time.perf_counter() - start, phases
+
+
+# one connection per pool worker, opened by init_worker
+_worker_conn = None
+
+
+def init_worker():
+	global _worker_conn
+	_worker_conn = psycopg2.connect(**DB)
+
+
+def load_job(csv_path, table_name, mode, chunksize, incremental, seen, fast):
+	"""Pool task: load one file over the worker's own connection; None if skipped."""
+	loaded = load_file(_worker_conn, csv_path, table_name, mode, chunksize, incremental, seen, fast)
+	return loaded and (table_name, *loaded)
+
+
+def report(table_name, rows, elapsed, phases=None):
+	rate = rows / elapsed if elapsed else 0
+	print(f"Created table {table_name} ({rows:,} rows, {elapsed:.1f}s, {rate:,.0f} rows/s)")
+	if phases:
+		print("    " + ", ".join(f"{name} {secs:.2f}s" for name, secs in phases.items()))
+
+
+def print_summary(results, wall):
+	"""Per-table and overall throughput once every file is in."""
+	total = sum(rows for _, rows, _, _ in results)
+	print(f"\n{'table':<20} {'rows':>12} {'seconds':>9} {'rows/s':>12}")
+	for table_name, rows, elapsed, _ in sorted(results):
+		rate = rows / elapsed if elapsed else 0
+		print(f"{table_name:<20} {rows:>12,} {elapsed:>9.1f} {rate:>12,.0f}")
+	rate = total / wall if wall else 0
+	print(f"{'total (wall)':<20} {total:>12,} {wall:>9.1f} {rate:>12,.0f}")
+
+
+def csv_files(path):
+	"""Yield (csv_path, table_name) for every CSV in the folder."""
+	for file in sorted(os.listdir(path)):
+		if file.endswith(".csv"):
+			yield os.path.join(path, file), os.path.splitext(file)[0]
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Create one table per CSV in ./customer")
+	parser.add_argument("--folder", default=folder, help="folder holding the monthly CSVs")
+	parser.add_argument("--mode", choices=["pandas", "stream", "binary"], default="pandas",
+						help="pandas: parse with pandas then COPY; stream: pipe the file to COPY as-is; "
+							 "binary: validate, reject bad rows and COPY in binary format")
+	parser.add_argument("--chunksize", type=int, default=None,
+						help=f"rows per chunk (pandas: whole file if unset, binary: {BINARY_CHUNK:,})")
+	parser.add_argument("--workers", type=int, default=1,
+						help="load this many files at once, one connection and transaction each")
+	parser.add_argument("--incremental", action="store_true",
+						help=f"skip files whose size/mtime/hash match {MANIFEST}")
+	parser.add_argument("--fast", action="store_true",
+						help="UNLOGGED staging table, deferred indexes, swap and ANALYZE")
+	return parser.parse_args()
+
 
-for file in os.listdir(folder):
-    if file.endswith(".csv"):
-        table_name = os.path.splitext(file)[0]
-        csv_path = os.path.join(folder, file)
-        print(f"Loading {csv_path}...")
+def load_sequential(files, args):
+	results = []
+	conn = psycopg2.connect(**DB)
+	for csv_path, table_name, seen in files:
+		print(f"Loading {csv_path}...")
+		loaded = load_file(conn, csv_path, table_name, args.mode, args.chunksize,
+						   args.incremental, seen, args.fast)
+		if loaded:
+			report(table_name, *loaded)
+			results.append((table_name, *loaded))
+	conn.close()
+	return results
 
-        df = pd.read_csv(csv_path)
 
-        cur.execute(f"DROP TABLE IF EXISTS {table_name};")
-        cur.execute(f"""
-        CREATE TABLE {table_name} (
-            event_time   TIMESTAMPTZ,
-            event_type   VARCHAR(20),
-            product_id   INTEGER,
-            price        NUMERIC(10,2),
-            user_id      BIGINT,
-            user_session UUID
-        );
-        """)
+def load_parallel(files, args):
+	results = []
+	with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+		futures = []
+		for csv_path, table_name, seen in files:
+			print(f"Loading {csv_path}...")
+			futures.append(pool.submit(load_job, csv_path, table_name, args.mode,
+									   args.chunksize, args.incremental, seen, args.fast))
+		for future in as_completed(futures):
+			result = future.result()
+			if result:
+				report(*result)
+				results.append(result)
+	return results
 
-        # Clean dataframe (replace NaN with \N for NULLs)
-        df = df.where(pd.notnull(df), None)
 
-        # Write CSV content to memory buffer
-        buffer = io.StringIO()
-        df.to_csv(buffer, index=False, header=False)
-        buffer.seek(0)
+def main():
+	args = parse_args()
+	files = list(csv_files(args.folder))
 
-        # Bulk copy directly into Postgres
-        cur.copy_from(buffer, table_name, sep=",", null="")
+	start = time.perf_counter()
+	conn = psycopg2.connect(**DB)
+	ensure_manifest(conn)
+	if args.incremental:
+		files = pending_files(conn, files)
+	else:
+		files = [(csv_path, table_name, None) for csv_path, table_name in files]
+	conn.close()
 
-        conn.commit()
-        print(f"Created table {table_name} ({len(df):,} rows)")
+	if args.workers > 1:
+		results = load_parallel(files, args)
+	else:
+		results = load_sequential(files, args)
+	print_summary(results, time.perf_counter() - start)
 
 
-conn.commit()
-cur.close()
-conn.close()
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,227 @@
+import csv
+import struct
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# COPY BINARY framing
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+TRAILER = struct.pack(">h", -1)
+
+# column order on the wire: fixed-width fields first, variable ones last
+COPY_COLUMNS = ["event_time", "product_id", "price", "user_id", "event_type", "user_session"]
+
+# columns of the source CSV, all read as text and typed by validate()
+CSV_COLUMNS = ["event_time", "event_type", "product_id", "price", "user_id", "user_session"]
+
+PG_EPOCH = pd.Timestamp("2000-01-01", tz="UTC")
+INT32 = 2**31 - 1
+INT64 = 2**63 - 1
+PRICE_LIMIT = 10**10            # cents; NUMERIC(10,2) tops out at 99999999.99
+EVENT_TYPE_LEN = 20
+# what Postgres takes as uuid: 32 hex digits, a hyphen allowed after any
+# group of 4, the whole optionally in braces
+UUID_HEX = r"[0-9a-fA-F]{4}(?:-?[0-9a-fA-F]{4}){7}"
+UUID_RE = rf"\{{{UUID_HEX}\}}|{UUID_HEX}"
+
+# numeric is sent as 3 base-10000 digits at weight 1: [I // 10^4, I % 10^4, cents * 100];
+# the server strips the leading/trailing zero digits on receipt
+NUMERIC_SIGN_NEG = 0x4000
+
+# ASCII hex digit -> nibble
+HEX = np.zeros(256, dtype=np.uint8)
+HEX[np.frombuffer(b"0123456789", np.uint8)] = np.arange(10)
+HEX[np.frombuffer(b"abcdef", np.uint8)] = np.arange(10, 16)
+HEX[np.frombuffer(b"ABCDEF", np.uint8)] = np.arange(10, 16)
+
+
+def read_chunks(csv_path, rows, bad_line):
+	"""
+	DataFrames of about rows rows of text columns, streamed from the CSV
+	by pyarrow. A line with the wrong number of fields is passed to
+	bad_line (a pyarrow InvalidRow: .text, .actual_columns) and skipped.
+	Empty fields are None, as COPY would load them as NULL.
+	"""
+	def handler(row):
+		bad_line(row)
+		return "skip"
+
+	reader = pa_csv.open_csv(
+		csv_path,
+		parse_options=pa_csv.ParseOptions(invalid_row_handler=handler),
+		convert_options=pa_csv.ConvertOptions(column_types={c: pa.string() for c in CSV_COLUMNS},
+											  strings_can_be_null=True))
+	pending, held = [], 0
+	for batch in reader:
+		pending.append(batch)
+		held += batch.num_rows
+		if held >= rows:
+			yield pa.Table.from_batches(pending).to_pandas()
+			pending, held = [], 0
+	if held:
+		yield pa.Table.from_batches(pending).to_pandas()
+
+
+def malformed(lines):
+	"""
+	Rejected rows for lines with the wrong number of fields, in the
+	layout of validate()'s rejects: fields in order, missing ones empty,
+	extra ones joined back into the last column.
+	"""
+	n = len(CSV_COLUMNS)
+	rows, reasons = [], []
+	for line in lines:
+		fields = next(csv.reader([line]), [])
+		reasons.append(f"{len(fields)} fields")
+		if len(fields) > n:
+			fields = fields[:n - 1] + [",".join(fields[n - 1:])]
+		rows.append(fields + [None] * (n - len(fields)))
+	return pd.DataFrame(rows, columns=CSV_COLUMNS).assign(reason=reasons)
+
+
+def validate(chunk):
+	"""
+	Convert a chunk of text columns (read_chunks) into typed columns,
+	vectorized. An empty field is NULL, as in the csv and stream modes,
+	except event_time, which the monthly partitions require; a field
+	that does not parse gets its row rejected.
+	Returns (typed DataFrame of valid rows, rejected raw rows with a reason).
+	"""
+	bad = np.zeros(len(chunk), dtype=bool)
+	reason = np.full(len(chunk), "", dtype=object)
+
+	def reject(mask, why):
+		new = mask.to_numpy(dtype=bool, na_value=False) & ~bad
+		reason[new] = why
+		bad[new] = True
+
+	def number(col):
+		# nullable types: a NULL in the chunk must not turn a BIGINT column into floats
+		raw = chunk[col]
+		value = pd.to_numeric(raw, errors="coerce", dtype_backend="numpy_nullable")
+		return value, value.isna() & raw.notna()
+
+	# an explicit naive format keeps pandas on its fast parser; %Z does not
+	text = chunk["event_time"].str.removesuffix(" UTC")
+	event_time = pd.to_datetime(text, format="%Y-%m-%d %H:%M:%S", errors="coerce").dt.tz_localize("UTC")
+	# fractional seconds, a T or an explicit offset, as Postgres accepts:
+	# the ISO 8601 parser, for those rows only
+	retry = event_time.isna() & text.notna()
+	if retry.any():
+		event_time = event_time.astype("datetime64[us, UTC]")
+		event_time[retry] = pd.to_datetime(text[retry], format="ISO8601", utc=True,
+										   errors="coerce").astype("datetime64[us, UTC]")
+	reject(event_time.isna(), "event_time")
+
+	event_type = chunk["event_type"].fillna("").str.lower()
+	reject(event_type.str.len() > EVENT_TYPE_LEN, "event_type")
+
+	product_id, garbage = number("product_id")
+	reject(garbage | (product_id % 1 != 0) | (product_id.abs() > INT32), "product_id")
+
+	price, garbage = number("price")
+	cents = (price * 100).round()
+	reject(garbage | (cents.abs() >= PRICE_LIMIT), "price")
+
+	user_id, garbage = number("user_id")
+	reject(garbage | (user_id % 1 != 0) | (user_id.abs() > INT64), "user_id")
+
+	session = chunk["user_session"].fillna("")
+	reject((session != "") & ~session.str.fullmatch(UUID_RE), "user_session")
+
+	ok = ~bad
+	typed = pd.DataFrame({
+		"event_time": event_time[ok],
+		"product_id": product_id[ok].astype("Int64"),
+		"cents": cents[ok].astype("Int64"),
+		"user_id": user_id[ok].astype("Int64"),
+		"event_type": event_type[ok],
+		"user_session": session[ok],
+	})
+	rejects = chunk[bad].assign(reason=reason[bad])
+	return typed, rejects
+
+
+def uuid_bytes(session):
+	"""Valid UUID strings (or "" for NULL) to an (n, 16) uint8 array, zeros for NULL."""
+	hexes = session.str.replace(r"[-{}]", "", regex=True).where(session != "", "0" * 32)
+	digits = HEX[hexes.to_numpy(dtype="S32").view(np.uint8).reshape(-1, 32)]
+	return digits[:, 0::2] * 16 + digits[:, 1::2]
+
+
+def encode(typed):
+	"""
+	Encode validated rows as COPY BINARY tuples (no header/trailer).
+	Every row is laid out at its maximal width in one structured array,
+	then the unused event_type padding and the bytes of NULL fields are
+	masked out, which keeps row order without a Python loop. NULL is a
+	missing value in the numeric columns and "" in the text ones.
+	"""
+	n = len(typed)
+	# event_type is low-cardinality: encode each distinct value once
+	event_type = typed["event_type"].astype("category")
+	labels = [label.encode("utf-8") for label in event_type.cat.categories]
+	codes = event_type.cat.codes.to_numpy()
+	type_len = np.array([len(label) for label in labels], dtype=np.int32)[codes]
+	width = max(max(map(len, labels), default=1), 1)
+	null_type = (typed["event_type"] == "").to_numpy()
+	null_session = (typed["user_session"] == "").to_numpy()
+	null_product = typed["product_id"].isna().to_numpy()
+	null_price = typed["cents"].isna().to_numpy()
+	null_user = typed["user_id"].isna().to_numpy()
+
+	dtype = np.dtype([
+		("nfields", ">i2"),
+		("t_len", ">i4"), ("t", ">i8"),
+		("p_len", ">i4"), ("p", ">i4"),
+		("n_len", ">i4"), ("n_ndigits", ">i2"), ("n_weight", ">i2"),
+		("n_sign", ">u2"), ("n_dscale", ">i2"), ("n_digits", ">i2", 3),
+		("u_len", ">i4"), ("u", ">i8"),
+		("e_len", ">i4"), ("e", f"S{width}"),
+		("s_len", ">i4"), ("s", "u1", 16),
+	])
+	rec = np.zeros(n, dtype=dtype)
+	rec["nfields"] = len(COPY_COLUMNS)
+
+	rec["t_len"] = 8
+	rec["t"] = ((typed["event_time"] - PG_EPOCH) // pd.Timedelta(microseconds=1)).to_numpy()
+
+	rec["p_len"] = np.where(null_product, -1, 4)
+	rec["p"] = typed["product_id"].to_numpy(dtype=np.int64, na_value=0)
+
+	cents = typed["cents"].to_numpy(dtype=np.int64, na_value=0)
+	whole, frac = np.divmod(np.abs(cents), 100)
+	rec["n_len"] = np.where(null_price, -1, 8 + 2 * 3)
+	rec["n_ndigits"] = 3
+	rec["n_weight"] = 1
+	rec["n_sign"] = np.where(cents < 0, NUMERIC_SIGN_NEG, 0)
+	rec["n_dscale"] = 2
+	rec["n_digits"] = np.stack([whole // 10000, whole % 10000, frac * 100], axis=1)
+
+	rec["u_len"] = np.where(null_user, -1, 8)
+	rec["u"] = typed["user_id"].to_numpy(dtype=np.int64, na_value=0)
+
+	rec["e_len"] = np.where(null_type, -1, type_len)
+	rec["e"] = np.array(labels, dtype=f"S{width}")[codes]
+
+	rec["s_len"] = np.where(null_session, -1, 16)
+	rec["s"] = uuid_bytes(typed["user_session"])
+
+	raw = rec.view(np.uint8).reshape(n, dtype.itemsize)
+	keep = np.ones_like(raw, dtype=bool)
+
+	def drop(first, last, null):
+		"""Mask out the bytes of fields first..last (one column's data) where null."""
+		lo = dtype.fields[first][1]
+		hi = dtype.fields[last][1] + dtype.fields[last][0].itemsize
+		keep[:, lo:hi] &= ~null[:, None]
+
+	drop("p", "p", null_product)
+	drop("n_ndigits", "n_digits", null_price)
+	drop("u", "u", null_user)
+	drop("s", "s", null_session)
+	e_off = dtype.fields["e"][1]
+	keep[:, e_off:e_off + width] = np.arange(width) < np.where(null_type, 0, type_len)[:, None]
+	return raw[keep].tobytes()
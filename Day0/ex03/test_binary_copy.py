@@ -0,0 +1,164 @@
+import io
+import struct
+import uuid
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+import binary_copy
+
+HEADER = ",".join(binary_copy.CSV_COLUMNS)
+
+SESSION = "123e4567-e89b-12d3-a456-426614174000"
+
+
+def utc(text):
+	return pd.Timestamp(text, tz="UTC")
+
+
+# (CSV line, row as Postgres would store it) in COPY_COLUMNS order
+ROWS = [
+	(f"2022-10-01 00:00:01 UTC,view,1,2.50,3,{SESSION}",
+	 (utc("2022-10-01 00:00:01"), 1, Decimal("2.50"), 3, "view", SESSION)),
+	# fractional seconds and an explicit offset go through the ISO parser
+	("2022-10-01 00:00:04.25 UTC,Cart,5,0.01,8,",
+	 (utc("2022-10-01 00:00:04.25"), 5, Decimal("0.01"), 8, "cart", None)),
+	("2022-10-01T02:00:03+02:00,purchase,2147483647,-12345678.99,9223372036854775807,"
+	 "{123E4567E89B12D3A456426614174000}",
+	 (utc("2022-10-01 00:00:03"), 2147483647, Decimal("-12345678.99"), 9223372036854775807,
+	  "purchase", SESSION)),
+	# every base-10000 digit group in use, and one price of each sign
+	("2022-10-31 23:59:59 UTC,remove_from_cart,-7,99999999.99,-1,1234-5678-9abc-def0-1234-5678-9abc-def0",
+	 (utc("2022-10-31 23:59:59"), -7, Decimal("99999999.99"), -1, "remove_from_cart",
+	  "12345678-9abc-def0-1234-56789abcdef0")),
+	("2022-10-02 00:00:00 UTC,view,10000,10000.00,0,",
+	 (utc("2022-10-02 00:00:00"), 10000, Decimal("10000.00"), 0, "view", None)),
+	# empty fields are NULL, as in the csv and stream modes
+	("2022-10-03 00:00:00 UTC,,,,,",
+	 (utc("2022-10-03 00:00:00"), None, None, None, None, None)),
+]
+
+
+def read(tmp_path, lines, bad=None):
+	path = tmp_path / "data.csv"
+	path.write_text("\n".join([HEADER] + lines) + "\n")
+	bad = [] if bad is None else bad
+	chunks = list(binary_copy.read_chunks(str(path), 1_000, lambda row: bad.append(row.text)))
+	return pd.concat(chunks, ignore_index=True)
+
+
+def decode(payload):
+	"""COPY BINARY back to tuples in COPY_COLUMNS order, as Postgres would read them."""
+	assert payload.startswith(binary_copy.HEADER) and payload.endswith(binary_copy.TRAILER)
+	pos, rows = len(binary_copy.HEADER), []
+	while True:
+		(nfields,) = struct.unpack_from(">h", payload, pos)
+		pos += 2
+		if nfields == -1:
+			break
+		assert nfields == len(binary_copy.COPY_COLUMNS)
+		fields = []
+		for _ in range(nfields):
+			(length,) = struct.unpack_from(">i", payload, pos)
+			pos += 4
+			fields.append(None if length == -1 else payload[pos:pos + length])
+			pos += max(length, 0)
+		rows.append(tuple(convert(value) if value is not None else None
+						  for convert, value in zip(DECODERS, fields)))
+	assert pos == len(payload)
+	return rows
+
+
+def numeric(raw):
+	ndigits, weight, sign, dscale = struct.unpack_from(">hhHh", raw)
+	digits = struct.unpack_from(f">{ndigits}h", raw, 8)
+	value = sum(Decimal(d) * Decimal(10000) ** (weight - i) for i, d in enumerate(digits))
+	value = -value if sign == binary_copy.NUMERIC_SIGN_NEG else value
+	return value.quantize(Decimal(10) ** -dscale)
+
+
+DECODERS = [
+	lambda raw: binary_copy.PG_EPOCH + pd.Timedelta(microseconds=struct.unpack(">q", raw)[0]),
+	lambda raw: struct.unpack(">i", raw)[0],
+	numeric,
+	lambda raw: struct.unpack(">q", raw)[0],
+	bytes.decode,
+	lambda raw: str(uuid.UUID(bytes=raw)),
+]
+
+
+def payload(typed):
+	return binary_copy.HEADER + binary_copy.encode(typed) + binary_copy.TRAILER
+
+
+def test_rows_round_trip(tmp_path):
+	typed, rejects = binary_copy.validate(read(tmp_path, [line for line, _ in ROWS]))
+	assert rejects.empty
+	assert decode(payload(typed)) == [row for _, row in ROWS]
+
+
+def test_a_null_in_the_chunk_keeps_bigints_exact(tmp_path):
+	typed, _ = binary_copy.validate(read(tmp_path, [
+		"2022-10-01 00:00:00 UTC,view,1,1,,", "2022-10-01 00:00:00 UTC,view,1,1,9007199254740993,"]))
+	assert [row[3] for row in decode(payload(typed))] == [None, 9007199254740993]
+
+
+def test_invalid_fields_are_rejected_with_their_column(tmp_path):
+	good = ROWS[0][0]
+	lines = [
+		good,
+		"2022-13-01 00:00:00 UTC,view,1,1,1,",
+		"2022-10-01 00:00:00 UTC," + "x" * (binary_copy.EVENT_TYPE_LEN + 1) + ",1,1,1,",
+		"2022-10-01 00:00:00 UTC,view,abc,1,1,",
+		"2022-10-01 00:00:00 UTC,view,2147483648,1,1,",
+		"2022-10-01 00:00:00 UTC,view,1,100000000.00,1,",
+		"2022-10-01 00:00:00 UTC,view,1,1,1.5,",
+		"2022-10-01 00:00:00 UTC,view,1,1,1,not-a-uuid",
+		"2022-10-01 00:00:00 UTC,view,1,1,1,{123e4567-e89b-12d3-a456-42661417400}",
+	]
+	typed, rejects = binary_copy.validate(read(tmp_path, lines))
+	assert decode(payload(typed)) == [ROWS[0][1]]
+	assert rejects["reason"].tolist() == ["event_time", "event_type", "product_id", "product_id",
+										  "price", "user_id", "user_session", "user_session"]
+	assert rejects["product_id"].tolist()[2:4] == ["abc", "2147483648"]
+
+
+def test_malformed_lines_go_to_the_handler(tmp_path):
+	bad = []
+	chunk = read(tmp_path, ["too,many,fields,1,2,3,4,5", ROWS[0][0], "short,line"], bad)
+	assert len(chunk) == 1
+	assert len(bad) == 2
+	rejects = binary_copy.malformed(bad)
+	assert rejects.columns.tolist() == binary_copy.CSV_COLUMNS + ["reason"]
+	assert rejects["reason"].tolist() == ["8 fields", "2 fields"]
+	assert rejects.iloc[0].tolist()[:6] == ["too", "many", "fields", "1", "2", "3,4,5"]
+	assert rejects.iloc[1].tolist()[:2] == ["short", "line"]
+	assert rejects.iloc[1, 2:6].isna().all()
+	assert binary_copy.malformed([]).columns.tolist() == binary_copy.CSV_COLUMNS + ["reason"]
+
+
+def test_postgres_reads_the_payload(tmp_path):
+	psycopg2 = pytest.importorskip("psycopg2")
+	from automatic_table import DB
+
+	try:
+		conn = psycopg2.connect(**DB)
+	except psycopg2.OperationalError as e:
+		pytest.skip(f"Postgres not reachable: {e}")
+	typed, _ = binary_copy.validate(read(tmp_path, [line for line, _ in ROWS]))
+	try:
+		cur = conn.cursor()
+		cur.execute("""
+			CREATE TEMP TABLE binary_copy_test (
+				event_time TIMESTAMPTZ, event_type VARCHAR(20), product_id INTEGER,
+				price NUMERIC(10, 2), user_id BIGINT, user_session UUID);
+		""")
+		cur.copy_expert(f"COPY binary_copy_test ({', '.join(binary_copy.COPY_COLUMNS)}) "
+						"FROM STDIN WITH (FORMAT binary)", io.BytesIO(payload(typed)))
+		cur.execute("SELECT event_time, product_id, price, user_id, event_type, user_session::text "
+					"FROM binary_copy_test;")
+		stored = [(pd.Timestamp(t),) + tuple(rest) for t, *rest in cur.fetchall()]
+	finally:
+		conn.close()
+	assert stored == [row for _, row in ROWS]
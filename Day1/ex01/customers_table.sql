@@ -5,4 +5,8 @@ SELECT * FROM data_2022_nov
 UNION ALL
 SELECT * FROM data_2022_dec
 UNION ALL
-SELECT * FROM data_2023_jan;
\ No newline at end of file
+SELECT * FROM data_2023_jan;
+
+-- every row of the plain customers is new to the steps built on it
+\ir ../../Day0/ex02/load_marks.sql
+SELECT mark_load('customers');
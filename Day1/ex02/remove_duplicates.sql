@@ -1,3 +1,33 @@
+-- An event within 1 second of the previous identical event is a
+-- duplicate. A plain customers (customers_table.sql) is rebuilt without
+-- them; the partitioned one (customers_partitioned.sql) holds the
+-- monthly tables as partitions, so its duplicates are deleted in place
+-- instead of dropping customers and the months with it.
+
+SELECT coalesce((SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('customers')),
+                false) AS partitioned \gset
+
+\if :partitioned
+
+DELETE FROM customers c
+USING (
+  SELECT rel, row_id
+  FROM (
+    SELECT tableoid AS rel, ctid AS row_id, event_time,
+           LAG(event_time) OVER (
+             PARTITION BY event_type, product_id, price, user_id, user_session
+             ORDER BY event_time
+           ) AS prev_time
+    FROM customers
+  ) t
+  WHERE event_time - prev_time <= interval '1 second'
+) d
+WHERE c.tableoid = d.rel AND c.ctid = d.row_id;
+
+VACUUM ANALYZE customers;
+
+\else
+
 DROP TABLE IF EXISTS customers_nodup;
 
 CREATE TABLE customers_nodup AS
@@ -15,3 +45,5 @@ WHERE prev_time IS NULL
 
 DROP TABLE IF EXISTS customers;
 ALTER TABLE customers_nodup RENAME TO customers;
+
+\endif
@@ -0,0 +1,200 @@
+-- Incremental version of remove_duplicates.sql: same rule (an event
+-- within 1 second of the previous identical event is a duplicate), but
+-- only rows newer than the last run are examined, one day at a time,
+-- and duplicates are deleted in place instead of rebuilding customers.
+-- Each slice also reads the second before it, plus the duplicates the
+-- previous slice deleted in its last second (dedup_tail), so events
+-- straddling a boundary are judged exactly as in a full run.
+-- Rows loaded behind the watermark (a reloaded or newly attached month,
+-- a rebuilt plain customers) are found from load_marks
+-- (Day0/ex02/load_marks.sql): a relation of customers whose load_id
+-- moved since the last run, or that was never seen, has its own time
+-- range deduplicated again first (dedup_late), from its oldest event to
+-- a second past its newest, overlapping ranges merged. On the plain
+-- customers table that is all history; on the partitioned one, only the
+-- months concerned.
+-- Run: SELECT dedup_new();   Backfill a range in order: SELECT dedup_slice(lo, hi);
+
+\ir ../../Day0/ex02/load_marks.sql
+
+-- the slice is found through this index instead of sorting all history
+CREATE INDEX IF NOT EXISTS customers_event_time_idx ON customers (event_time);
+
+CREATE TABLE IF NOT EXISTS dedup_progress (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    processed_to TIMESTAMPTZ NOT NULL
+);
+
+-- each relation of customers as last deduplicated: its load_id then
+CREATE TABLE IF NOT EXISTS dedup_loads (
+    table_name TEXT PRIMARY KEY,
+    load_id BIGINT
+);
+
+CREATE TABLE IF NOT EXISTS dedup_tail (
+    event_time TIMESTAMPTZ,
+    event_type VARCHAR(20),
+    product_id INTEGER,
+    price NUMERIC(10,2),
+    user_id BIGINT,
+    user_session UUID
+);
+
+CREATE OR REPLACE FUNCTION dedup_slice(lo timestamptz, hi timestamptz)
+RETURNS bigint AS $$
+DECLARE
+    removed bigint;
+BEGIN
+    DROP TABLE IF EXISTS dedup_doomed;
+    EXECUTE format($q$
+        CREATE TEMP TABLE dedup_doomed AS
+        WITH candidates AS (
+            SELECT c.tableoid AS rel, c.ctid AS row_id,
+                   c.event_time, c.event_type, c.product_id, c.%1$I AS price, c.user_id, c.user_session
+            FROM customers c
+            WHERE c.event_time >= $1 - interval '1 second'
+              AND c.event_time < $2
+            UNION ALL
+            SELECT NULL, NULL,
+                   t.event_time, t.event_type, t.product_id, t.price, t.user_id, t.user_session
+            FROM dedup_tail t
+        ),
+        ranked AS (
+            SELECT *,
+                   LAG(event_time) OVER (
+                     PARTITION BY event_type, product_id, price, user_id, user_session
+                     ORDER BY event_time
+                   ) AS prev_time
+            FROM candidates
+        )
+        SELECT rel, row_id, event_time, event_type, product_id, price, user_id, user_session
+        FROM ranked
+        WHERE event_time >= $1
+          AND event_time - prev_time <= interval '1 second'
+    $q$, customers_price_col()) USING lo, hi;
+
+    DELETE FROM customers c
+    USING dedup_doomed d
+    WHERE c.tableoid = d.rel AND c.ctid = d.row_id
+      AND c.event_time >= lo AND c.event_time < hi;
+    GET DIAGNOSTICS removed = ROW_COUNT;
+
+    -- keep what the next slice's overlap second needs
+    DELETE FROM dedup_tail WHERE event_time < hi - interval '1 second';
+    INSERT INTO dedup_tail
+    SELECT event_time, event_type, product_id, price, user_id, user_session
+    FROM dedup_doomed
+    WHERE event_time >= hi - interval '1 second';
+
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- deduplicate again the time range of every relation loaded since the
+-- last run (in dedup_current, as dedup_new found them) that holds rows
+-- behind the watermark
+CREATE OR REPLACE FUNCTION dedup_late(watermark timestamptz)
+RETURNS bigint AS $$
+DECLARE
+    r record;
+    lo timestamptz;
+    hi timestamptz;
+    day_end timestamptz;
+    removed bigint := 0;
+BEGIN
+    DROP TABLE IF EXISTS dedup_ranges;
+    CREATE TEMP TABLE dedup_ranges (lo timestamptz, hi timestamptz);
+    FOR r IN
+        SELECT n.rel
+        FROM dedup_current n
+        LEFT JOIN dedup_loads o ON o.table_name = n.rel::text
+        WHERE o.table_name IS NULL OR o.load_id IS DISTINCT FROM n.load_id
+    LOOP
+        -- a second past the newest row: the next event may be its duplicate
+        EXECUTE format('SELECT min(event_time), max(event_time) + interval ''1 second'' FROM %s', r.rel)
+        INTO lo, hi;
+        CONTINUE WHEN lo IS NULL OR lo >= watermark;
+        RAISE NOTICE 'dedup: % was loaded since the last run, redoing % to %',
+            r.rel, lo, least(hi, watermark);
+        -- past the watermark, dedup_new's own pass covers it
+        INSERT INTO dedup_ranges VALUES (lo, least(hi, watermark));
+    END LOOP;
+
+    -- the tail belongs to the watermark; each range starts with its own
+    DROP TABLE IF EXISTS dedup_tail_saved;
+    CREATE TEMP TABLE dedup_tail_saved AS SELECT * FROM dedup_tail;
+
+    FOR r IN
+        -- a range starts a group unless an earlier one reaches it
+        SELECT min(g.lo) AS lo, max(g.hi) AS hi
+        FROM (
+            SELECT s.lo, s.hi, count(*) FILTER (WHERE s.starts) OVER (ORDER BY s.lo, s.hi) AS grp
+            FROM (
+                SELECT d.lo, d.hi,
+                       coalesce(d.lo > max(d.hi) OVER (ORDER BY d.lo, d.hi
+                                                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING),
+                                true) AS starts
+                FROM dedup_ranges d
+            ) s
+        ) g
+        GROUP BY g.grp
+        ORDER BY 1
+    LOOP
+        TRUNCATE dedup_tail;
+        lo := r.lo;
+        WHILE lo < r.hi LOOP
+            day_end := least(date_trunc('day', lo) + interval '1 day', r.hi);
+            removed := removed + dedup_slice(lo, day_end);
+            lo := day_end;
+        END LOOP;
+    END LOOP;
+
+    TRUNCATE dedup_tail;
+    INSERT INTO dedup_tail SELECT * FROM dedup_tail_saved;
+    DROP TABLE dedup_tail_saved;
+    DROP TABLE dedup_ranges;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dedup_new()
+RETURNS bigint AS $$
+DECLARE
+    lo timestamptz;
+    hi timestamptz;
+    day_end timestamptz;
+    removed bigint := 0;
+BEGIN
+    -- the marks as of now: a load committing during the run is redone next time
+    DROP TABLE IF EXISTS dedup_current;
+    CREATE TEMP TABLE dedup_current AS SELECT * FROM customers_loads();
+
+    SELECT processed_to INTO lo FROM dedup_progress;
+    IF lo IS NULL THEN
+        SELECT min(event_time) INTO lo FROM customers;
+    ELSE
+        -- first, so the pass below sees the backfilled rows in its overlap second
+        removed := dedup_late(lo);
+    END IF;
+    SELECT max(event_time) + interval '1 microsecond' INTO hi FROM customers;
+
+    IF lo IS NOT NULL AND lo < hi THEN
+        WHILE lo < hi LOOP
+            day_end := least(date_trunc('day', lo) + interval '1 day', hi);
+            removed := removed + dedup_slice(lo, day_end);
+            lo := day_end;
+        END LOOP;
+
+        INSERT INTO dedup_progress (processed_to) VALUES (hi)
+        ON CONFLICT (id) DO UPDATE SET processed_to = EXCLUDED.processed_to;
+    END IF;
+
+    -- the loads marked so far are accounted for
+    DELETE FROM dedup_loads;
+    INSERT INTO dedup_loads SELECT rel::text, load_id FROM dedup_current;
+    DROP TABLE dedup_current;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT dedup_new() AS duplicates_removed;
@@ -0,0 +1,214 @@
+"""
+Export the cleaned customers table as a Parquet snapshot, one
+partition per month (customers_parquet/month=2022-10/part-0.parquet),
+to run after remove_duplicates.sql and fusion.sql.
+
+Rows come out of Postgres through COPY TO STDOUT and are parsed by
+pyarrow's CSV reader straight into typed columns (Day2/copy_stream.py),
+then written in event_time order, so row-group statistics let a reader
+skip by time; event_type, category_code and brand are
+dictionary-encoded, and the price is stored as float64. Months are
+whole UTC months. Each file records the row count, newest event_time
+and a checksum of the rows of its month: a rerun rewrites only the
+months that changed, an in-place update included, and drops the months
+the table no longer has. Day2 reads the snapshot when CUSTOMERS_PARQUET points at it.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Day2"))
+import copy_stream
+
+DB = dict(
+	dbname="piscineds",
+	user="gtskitis",
+	password="mysecretpassword",
+	host="localhost"
+)
+
+folder = "./customers_parquet"
+
+# rows written as one row group
+BATCH = 100_000
+
+# low-cardinality text columns, stored as dictionary indices
+DICTIONARY = ["event_type", "category_code", "brand"]
+
+# Postgres type -> (select expression, Arrow type); anything else is exported as text
+TYPES = {
+	"timestamp with time zone": ("{}", pa.timestamp("us", tz="UTC")),
+	"integer":                  ("{}", pa.int32()),
+	"bigint":                   ("{}", pa.int64()),
+	"numeric":                  ("{}::float8", pa.float64()),
+}
+
+META_KEY = b"piscine.export"
+
+
+def table_columns(cur, table_name):
+	"""Column names and Postgres types of the table, in order."""
+	cur.execute("""
+		SELECT column_name, data_type FROM information_schema.columns
+		WHERE table_schema = 'public' AND table_name = %s
+		ORDER BY ordinal_position;
+	""", (table_name,))
+	cols = cur.fetchall()
+	if not cols:
+		raise SystemExit(f"Table {table_name} not found.")
+	return cols
+
+
+def arrow_schema(cols):
+	"""Select list and Arrow schema for the table's columns."""
+	select, fields = [], []
+	for name, kind in cols:
+		expr, arrow = TYPES.get(kind, ("{}::text", pa.string()))
+		if name in DICTIONARY:
+			arrow = pa.dictionary(pa.int32(), pa.string())
+		select.append(expr.format(name) + f" AS {name}")
+		fields.append(pa.field(name, arrow))
+	return ", ".join(select), pa.schema(fields)
+
+
+def months(cur, table_name):
+	"""
+	{'YYYY-MM': (rows, newest event_time, checksum)} for every month in
+	the table (UTC). The checksum sums a 64-bit hash of each row's text,
+	so it changes with any row added, removed or updated.
+	"""
+	cur.execute(f"""
+		SELECT to_char(t.event_time AT TIME ZONE 'UTC', 'YYYY-MM'), count(*), max(t.event_time)::text,
+		       sum(hashtextextended(t::text, 0)::numeric)::text
+		FROM {table_name} AS t
+		GROUP BY 1;
+	""")
+	found, skipped = {}, 0
+	for month, rows, newest, checksum in cur.fetchall():
+		if month is None:
+			skipped = rows
+		else:
+			found[month] = (rows, newest, checksum)
+	if skipped:
+		print(f"    {skipped:,} rows without event_time are not exported")
+	return found
+
+
+def exported(path):
+	"""(rows, newest event_time, checksum) recorded in an exported file, or None."""
+	try:
+		meta = pq.read_metadata(path).metadata or {}
+	except (OSError, pa.ArrowInvalid):
+		return None
+	if META_KEY not in meta:
+		return None
+	info = json.loads(meta[META_KEY])
+	return info["rows"], info["newest"], info.get("checksum")
+
+
+def month_bounds(month):
+	"""First instant of the month and of the next one, in UTC."""
+	year, mon = map(int, month.split("-"))
+	year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+	return f"{month}-01 00:00:00+00", f"{year:04d}-{mon:02d}-01 00:00:00+00"
+
+
+def write_batches(writer, schema):
+	"""
+	consume() for copy_stream.read(): encode each batch of the CSV reader
+	to the snapshot schema and write it in row groups of BATCH rows.
+	"""
+	def consume(reader):
+		pending, held = [], 0
+		for batch in reader:
+			arrays = [col.dictionary_encode() if pa.types.is_dictionary(f.type) else col
+					  for col, f in zip(batch.columns, schema)]
+			pending.append(pa.RecordBatch.from_arrays(arrays, schema=schema))
+			held += batch.num_rows
+			if held >= BATCH:
+				# whole row groups out, the remainder starts the next one
+				table = pa.Table.from_batches(pending)
+				full = held - held % BATCH
+				writer.write_table(table.slice(0, full), row_group_size=BATCH)
+				pending, held = table.slice(full).to_batches(), held - full
+		if pending:
+			writer.write_table(pa.Table.from_batches(pending), row_group_size=BATCH)
+	return consume
+
+
+def export_month(conn, table_name, select, schema, month, found, out):
+	"""Write one month to out/month=YYYY-MM/part-0.parquet, replacing it atomically."""
+	part = os.path.join(out, f"month={month}")
+	os.makedirs(part, exist_ok=True)
+	path = os.path.join(part, "part-0.parquet")
+	tmp = path + ".tmp"
+	rows, newest, checksum = found
+	schema = schema.with_metadata(
+		{META_KEY: json.dumps({"rows": rows, "newest": newest, "checksum": checksum})})
+	start, end = month_bounds(month)
+	sql = conn.cursor().mogrify(f"""
+		SELECT {select} FROM {table_name}
+		WHERE event_time >= %(start)s AND event_time < %(end)s
+		ORDER BY event_time
+	""", {"start": start, "end": end}).decode()
+	# dictionary columns are read as text and encoded batch by batch
+	types = {f.name: pa.string() if pa.types.is_dictionary(f.type) else f.type for f in schema}
+	with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+		copy_stream.read(conn, sql, types, write_batches(writer, schema))
+	os.replace(tmp, path)
+	return path
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Export customers as Parquet partitioned by month")
+	parser.add_argument("--table", default=os.environ.get("CUSTOMERS_TABLE", "customers"),
+						help="table or view to export (default: customers)")
+	parser.add_argument("--out", default=folder, help="snapshot folder")
+	parser.add_argument("--rebuild", action="store_true", help="rewrite every month")
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	conn = psycopg2.connect(**DB)
+	try:
+		with conn.cursor() as cur:
+			# timestamps leave COPY in UTC, as the Arrow schema stores them
+			cur.execute("SET timezone = 'UTC';")
+			select, schema = arrow_schema(table_columns(cur, args.table))
+			found = months(cur, args.table)
+
+		os.makedirs(args.out, exist_ok=True)
+		for name in sorted(os.listdir(args.out)):
+			if name.startswith("month=") and name[len("month="):] not in found:
+				shutil.rmtree(os.path.join(args.out, name))
+				print(f"Removed {name} (no longer in {args.table})")
+
+		total = 0
+		wall = time.perf_counter()
+		for month, info in sorted(found.items()):
+			rows = info[0]
+			path = os.path.join(args.out, f"month={month}", "part-0.parquet")
+			if not args.rebuild and exported(path) == info:
+				print(f"Skipping {month} (unchanged)")
+				continue
+			start = time.perf_counter()
+			export_month(conn, args.table, select, schema, month, info, args.out)
+			elapsed = time.perf_counter() - start
+			size = os.path.getsize(path) / 2**20
+			print(f"Exported {month} ({rows:,} rows, {size:.1f} MB, {elapsed:.1f}s)")
+			total += rows
+	finally:
+		conn.close()
+	print(f"[✔] {total:,} rows exported to {args.out} in {time.perf_counter() - wall:.1f}s")
+
+
+if __name__ == "__main__":
+	main()
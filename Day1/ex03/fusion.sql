@@ -1,3 +1,18 @@
+-- Adds the item columns to customers. A plain customers is replaced by
+-- the joined copy; the partitioned one (customers_partitioned.sql) holds
+-- the monthly tables as partitions and is not dropped: it is enriched
+-- at read time through customers_enriched (fusion_view.sql) instead.
+
+SELECT coalesce((SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('customers')),
+                false) AS partitioned \gset
+
+\if :partitioned
+
+\echo customers is partitioned: enriching it through the customers_enriched view
+\ir fusion_view.sql
+
+\else
+
 BEGIN;
 
 DROP TABLE IF EXISTS fusion;
@@ -21,3 +36,5 @@ DROP TABLE IF EXISTS customers;
 ALTER TABLE fusion RENAME TO customers;
 
 COMMIT;
+
+\endif
@@ -0,0 +1,48 @@
+-- In-place alternative to fusion.sql: customers is left untouched and
+-- the item columns are joined at read time through customers_enriched,
+-- which has the same columns fusion.sql produces. items is first
+-- collapsed to one row per product_id (items_dim), so a product listed
+-- twice no longer multiplies its events. A catalog refresh only
+-- rebuilds items_dim: SELECT refresh_items_dim();
+
+CREATE TABLE IF NOT EXISTS items_dim (
+    product_id INTEGER PRIMARY KEY,
+    category_id BIGINT,
+    category_code TEXT,
+    brand VARCHAR(50)
+);
+
+CREATE OR REPLACE FUNCTION refresh_items_dim()
+RETURNS bigint AS $$
+DECLARE
+    n bigint;
+BEGIN
+    -- duplicate listings are merged column by column, keeping known values
+    DELETE FROM items_dim;
+    INSERT INTO items_dim
+    SELECT product_id, max(category_id), max(category_code), max(brand)
+    FROM items
+    WHERE product_id IS NOT NULL
+    GROUP BY product_id;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    ANALYZE items_dim;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_items_dim() AS products;
+
+CREATE OR REPLACE VIEW customers_enriched AS
+SELECT
+    c.event_time,
+    c.event_type,
+    c.product_id,
+    c.price        AS event_price,
+    c.user_id,
+    c.user_session,
+    i.category_id,
+    i.category_code,
+    i.brand
+FROM customers AS c
+LEFT JOIN items_dim AS i
+    ON c.product_id = i.product_id;
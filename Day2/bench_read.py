@@ -0,0 +1,83 @@
+"""
+Benchmark reading a large result out of Postgres: pd.read_sql_query
+over SQLAlchemy, which builds a Python object per value, against
+copy_stream.read (behind db.copy_query), which parses COPY TO STDOUT
+into typed columns. The rows are synthetic purchases written to a
+scratch table (bench_purchases, dropped afterwards); the result cache
+is bypassed.
+
+    python bench_read.py                 # 1M and 5M rows
+    python bench_read.py --sizes 10M
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import copy_stream
+import db
+from bench_rfm import size
+
+TABLE = "bench_purchases"
+
+FILL = f"""
+DROP TABLE IF EXISTS {TABLE};
+CREATE UNLOGGED TABLE {TABLE} AS
+SELECT timestamptz '2022-10-01 00:00:00+00' + (random() * interval '150 days') AS event_time,
+       'purchase'::varchar(20) AS event_type,
+       (random() * 60000000)::int AS product_id,
+       round((random() * 50)::numeric, 2)::numeric(10,2) AS event_price,
+       (10000000 + random() * %(users)s)::bigint AS user_id,
+       gen_random_uuid() AS user_session
+FROM generate_series(1, %(rows)s);
+"""
+
+SELECT = f"SELECT event_time, user_id, event_price FROM {TABLE}"
+
+
+def read_sql():
+    with db.engine().connect() as conn:
+        return pd.read_sql_query(SELECT, conn)
+
+
+def read_copy():
+    with db.engine().connect() as conn:
+        return copy_stream.read(conn.connection.dbapi_connection, SELECT, db.COPY_TYPES,
+                                lambda reader: reader.read_all().to_pandas())
+
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark read_sql_query against COPY")
+    parser.add_argument("--sizes", nargs="+", type=size, default=[1_000_000, 5_000_000],
+                        help="row counts, e.g. 1M 5M")
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'read_sql s':>11} {'copy s':>8} {'speedup':>8} {'sql MB':>8} {'copy MB':>8}")
+    try:
+        for rows in args.sizes:
+            with db.engine().begin() as conn:
+                conn.exec_driver_sql(FILL, {"rows": rows, "users": max(rows // 10, 1)})
+            slow, ref = timed(read_sql)
+            fast, out = timed(read_copy)
+            assert len(ref) == len(out) == rows
+            assert np.array_equal(ref["user_id"].to_numpy(), out["user_id"].to_numpy())
+            assert np.allclose(ref["event_price"].astype(float), out["event_price"])
+            assert (pd.to_datetime(ref["event_time"], utc=True) == out["event_time"]).all()
+            sql_mb = ref.memory_usage(deep=True).sum() / 2**20
+            copy_mb = out.memory_usage(deep=True).sum() / 2**20
+            print(f"{rows:>12,} {slow:>11.2f} {fast:>8.2f} {slow / fast:>7.1f}x "
+                  f"{sql_mb:>8.1f} {copy_mb:>8.1f}")
+    finally:
+        with db.engine().begin() as conn:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {TABLE};")
+
+
+if __name__ == "__main__":
+    main()
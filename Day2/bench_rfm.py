@@ -0,0 +1,78 @@
+"""
+Benchmark the RFM builder: the per-user lambda Clustering.py used to
+run against features.rfm, on synthetic purchases (one user per ten
+rows, five months of timestamps).
+
+    python bench_rfm.py                      # 1M, 10M and 50M rows
+    python bench_rfm.py --sizes 1M 5M --no-legacy
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import features
+
+
+def legacy_rfm(df):
+    """The original groupby.agg with a Python lambda per user."""
+    now = df["event_time"].max() + pd.Timedelta(days=1)
+    return (
+        df.groupby("user_id")
+          .agg(
+              recency=("event_time", lambda x: (now - x.max()).days / 30.0),
+              frequency=("event_time", "count"),
+              monetary=("event_price", "sum"),
+          )
+          .reset_index()
+    )
+
+
+def purchases(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2022-10-01", tz="UTC").value
+    span = pd.Timedelta(days=150).value
+    return pd.DataFrame({
+        "event_time": pd.to_datetime(start + rng.integers(0, span, rows), utc=True),
+        "user_id": rng.integers(10_000_000, 10_000_000 + max(rows // 10, 1), rows),
+        "event_price": rng.gamma(2.0, 5.0, rows).round(2),
+    })
+
+
+def size(text):
+    text = text.upper()
+    scale = {"K": 1_000, "M": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("KM")) * scale)
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    out = fn(df)
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RFM builder")
+    parser.add_argument("--sizes", nargs="+", type=size, default=[1_000_000, 10_000_000, 50_000_000],
+                        help="purchase row counts, e.g. 1M 10M 50M")
+    parser.add_argument("--no-legacy", action="store_true",
+                        help="skip the lambda version (minutes at 50M rows)")
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'users':>10} {'lambda s':>10} {'vector s':>10} {'speedup':>8} {'MB':>8}")
+    for rows in args.sizes:
+        df = purchases(rows)
+        fast, out = timed(features.rfm, df)
+        mb = out.memory_usage(deep=True).sum() / 2**20
+        if args.no_legacy:
+            print(f"{rows:>12,} {len(out):>10,} {'-':>10} {fast:>10.2f} {'-':>8} {mb:>8.1f}")
+            continue
+        slow, ref = timed(legacy_rfm, df)
+        assert np.array_equal(ref["frequency"], out["frequency"])
+        assert np.allclose(ref["recency"], out["recency"], atol=1e-6)
+        print(f"{rows:>12,} {len(out):>10,} {slow:>10.2f} {fast:>10.2f} {slow / fast:>7.1f}x {mb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+COPY (query) TO STDOUT parsed by pyarrow while Postgres is still sending.
+
+A thread writes the CSV stream into a pipe that pyarrow's multithreaded
+CSV reader consumes block by block, so no Python object is made per
+value and the whole text never sits in memory. Used by db.copy_query()
+and Day1/ex03/export_parquet.py.
+"""
+import os
+import threading
+
+import pyarrow.csv as pa_csv
+
+
+def read(dbapi_conn, sql, types, consume):
+    """
+    Run COPY (sql) TO STDOUT as CSV and return consume(reader), reader
+    being a pyarrow CSV stream reader with column_types types. When the
+    query fails, the server's error is raised even if the truncated
+    stream also failed to parse; when the parse (or consume) fails, its
+    error is raised, not the broken pipe the sender then runs into.
+    """
+    read_fd, write_fd = os.pipe()
+    failed = []
+
+    def send():
+        try:
+            with os.fdopen(write_fd, "wb") as out:
+                dbapi_conn.cursor().copy_expert(
+                    f"COPY ({sql.strip().rstrip(';')}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+        except Exception as e:
+            failed.append(e)
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    try:
+        # closing the read end on the way out unblocks the sender
+        with os.fdopen(read_fd, "rb") as src:
+            # COPY writes NULL unquoted and the empty string as ""
+            reader = pa_csv.open_csv(src, convert_options=pa_csv.ConvertOptions(
+                column_types=types, strings_can_be_null=True, quoted_strings_can_be_null=False))
+            result = consume(reader)
+    except BaseException:
+        sender.join()
+        if failed and not isinstance(failed[0], BrokenPipeError):
+            raise failed[0]
+        raise
+    sender.join()
+    if failed:
+        raise failed[0]
+    return result
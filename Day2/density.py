@@ -0,0 +1,85 @@
+"""
+Scatter plots that stay fast with millions of points.
+
+Up to a threshold of points, scatter() draws ordinary markers. Above
+it, each color group is binned on one shared grid, datashader style,
+and the grid is drawn as a single raster image: every cell takes the
+count-weighted mix of its groups' colors, with opacity growing with
+the log of its point count. Render time then depends on the grid size
+and not on the number of points, and the groups stay distinguishable.
+DENSITY_THRESHOLD sets the threshold (default 100000 points).
+"""
+import os
+
+import numpy as np
+from matplotlib.colors import to_rgb
+
+THRESHOLD = int(os.environ.get("DENSITY_THRESHOLD", 100_000))
+GRID = (480, 360)
+
+
+def _edges(v, n):
+    lo, hi = v.min(), v.max()
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, n + 1)
+
+
+def scatter(ax, x, y, group=None, colors="gray", labels=None, threshold=None, **kwargs):
+    """
+    Scatter x against y on ax. With group, colors and labels are dicts
+    keyed by group value (drawn in colors' order); without, one color
+    and one label. kwargs go to ax.scatter for the marker plot and size
+    the legend markers of the density image. Returns True when the
+    density image was drawn.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if group is None:
+        keys, group = [None], np.full(len(x), None)
+        colors, labels = {None: colors}, {None: labels}
+    else:
+        keys, group = list(colors), np.asarray(group)
+    labels = labels or {}
+    threshold = THRESHOLD if threshold is None else threshold
+
+    if len(x) <= threshold:
+        for key in keys:
+            mask = group == key
+            ax.scatter(x[mask], y[mask], color=colors[key], label=labels.get(key), **kwargs)
+        return False
+
+    # the legend markers keep the marker plot's size, shape and alpha
+    image(ax, x, y, group, colors, labels,
+          **{k: v for k, v in kwargs.items() if k in ("s", "marker", "alpha")})
+    return True
+
+
+def image(ax, x, y, group, colors, labels=None, **legend):
+    """
+    Draw x against y on ax as one raster image of per-cell counts: each
+    group of colors (a dict keyed by group value) is binned on a shared
+    grid and every cell takes the count-weighted mix of their colors.
+    Groups with a label get an empty scatter, styled by legend, as their
+    legend entry.
+    """
+    x, y, group = np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(group)
+    labels = labels or {}
+    keys = list(colors)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y, group = x[finite], y[finite], group[finite]
+    x_edges, y_edges = _edges(x, GRID[0]), _edges(y, GRID[1])
+    counts = np.stack([np.histogram2d(x[group == key], y[group == key],
+                                      bins=(x_edges, y_edges))[0] for key in keys])
+    total = counts.sum(axis=0)
+    rgb = np.array([to_rgb(colors[key]) for key in keys])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mix = np.einsum("gij,gc->ijc", counts, rgb) / total[..., None]
+    alpha = np.where(total > 0, 0.35 + 0.65 * np.log1p(total) / np.log1p(max(total.max(), 1)), 0.0)
+    ax.imshow(np.dstack([np.nan_to_num(mix), alpha]).transpose(1, 0, 2),
+              extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]),
+              origin="lower", aspect="auto", interpolation="nearest", rasterized=True)
+
+    # empty scatters carry the legend entries
+    for key in keys:
+        if labels.get(key) is not None:
+            ax.scatter([], [], color=colors[key], label=labels[key], **legend)
@@ -0,0 +1,215 @@
+"""
+Distinct users and sessions per month, from stored HyperLogLog sketches.
+
+One sketch per month and column (user_id, user_session) is built in
+Postgres with the hll.sql functions and kept in distinct_sketches with
+the load mark (Day0/ex02/load_marks.sql) of the tables holding the
+month's rows, as in sketches.py, and the newest event of the month it
+covers (through). A month whose mark moved (reloaded, or attached after
+newer ones) is sketched again from scratch; otherwise only the events
+after its watermark are read, through the event_time index, and their
+sketch is merged into the stored one. The
+distinct count of any range of months merges the stored sketches
+(hll_union) instead of reading events: a user active in several
+months is counted once. Counts are
+within STD_ERROR (1.6%) one time in three and twice that 95% of the
+time; --exact checks them against count(DISTINCT ...).
+
+    python distinct.py                              # sketch new months, count per month
+    python distinct.py --from 2022-10 --to 2022-12  # one count over Oct → Dec
+    python distinct.py --rebuild --exact
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+import db
+from sketches import LOAD_MARKS_SQL, month_loads
+
+COLUMNS = ["user_id", "user_session"]
+
+# 2^12 registers (hll.sql)
+STD_ERROR = 1.04 / 4096 ** 0.5
+
+HLL_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hll.sql")
+
+SKETCH_TABLE = """
+CREATE TABLE IF NOT EXISTS distinct_sketches (
+    month DATE NOT NULL,
+    col TEXT NOT NULL,
+    load_id BIGINT,
+    through TIMESTAMPTZ NOT NULL,
+    sketch INT[] NOT NULL,
+    PRIMARY KEY (month, col)
+);
+"""
+
+
+def _setup(conn):
+    with open(HLL_SQL) as f:
+        # straight to the driver: with no parameters, the % in its comments stay text
+        conn.connection.dbapi_connection.cursor().execute(f.read())
+    with open(LOAD_MARKS_SQL) as f:
+        conn.exec_driver_sql(f.read())
+    conn.exec_driver_sql(SKETCH_TABLE)
+
+
+def _month_where(month, after=None):
+    start = month.start_time.strftime("%Y-%m-%d")
+    end = (month + 1).start_time.strftime("%Y-%m-%d")
+    where = f"event_time >= '{start} 00:00:00+00' AND event_time < '{end} 00:00:00+00'"
+    return where if after is None else f"{where} AND event_time > %(after)s"
+
+
+def _span(conn):
+    """Oldest and newest event of customers, from the event_time index."""
+    return conn.exec_driver_sql(f"SELECT min(event_time), max(event_time) FROM {db.CUSTOMERS};").one()
+
+
+def _month_of(ts):
+    return pd.Period(pd.Timestamp(ts).tz_convert("UTC").strftime("%Y-%m"), freq="M")
+
+
+def _month_ends(conn, oldest, newest):
+    """Newest event of each month with events in [oldest, newest], one index lookup per month."""
+    ends = {}
+    for month in pd.period_range(_month_of(oldest), _month_of(newest), freq="M"):
+        end = conn.exec_driver_sql(
+            f"SELECT max(event_time) FROM {db.CUSTOMERS} WHERE {_month_where(month)};").scalar()
+        if end is not None:
+            ends[month] = end
+    return ends
+
+
+def refresh(rebuild=False):
+    """
+    Sketch again the months that are new or whose load mark moved, and
+    fold the events newer than its watermark into the sketches of any
+    other month whose newest event is past it; rebuild redoes all. Rows
+    deleted from a month without a new load need a rebuild.
+    """
+    with db.engine().begin() as conn:
+        _setup(conn)
+        if rebuild:
+            conn.exec_driver_sql("TRUNCATE distinct_sketches;")
+        stored = {pd.Period(month, freq="M"): (through, load_id)
+                  for month, through, load_id in conn.exec_driver_sql(
+                      "SELECT month, min(through), min(load_id) FROM distinct_sketches GROUP BY month;").all()}
+        oldest, newest = _span(conn)
+        if newest is None:
+            return 0
+        ends = _month_ends(conn, oldest, newest)
+        # marks read before the rows: a load landing in between is redone next time
+        loads = month_loads(conn, list(ends))
+    # month -> events after this time, None for all of them
+    todo = {}
+    for month, end in ends.items():
+        through, load_id = stored.get(month, (None, None))
+        if through is None or load_id != loads[month]:
+            todo[month] = None
+        elif through < end:
+            todo[month] = through
+
+    values = ", ".join(f"('{col}', {col}::text)" for col in COLUMNS)
+    for month, after in todo.items():
+        start = time.perf_counter()
+        params = {"month": month.start_time.date(), "load_id": loads[month],
+                  "through": ends[month], "after": after}
+        with db.engine().begin() as conn:
+            if after is None:
+                conn.exec_driver_sql("DELETE FROM distinct_sketches WHERE month = %(month)s;", params)
+            # one scan of the new events: each gives one (column, value) pair
+            # per sketched column; their sketch merges into the stored one
+            conn.exec_driver_sql(f"""
+                INSERT INTO distinct_sketches AS d (month, col, load_id, through, sketch)
+                SELECT %(month)s, col, %(load_id)s, %(through)s, array_agg(reg << 8 | rank ORDER BY reg)
+                FROM (
+                    SELECT col, r >> 8 AS reg, max(r & 255) AS rank
+                    FROM (
+                        -- r once per value: OFFSET 0 keeps the planner from
+                        -- folding this in and hashing again per use
+                        SELECT v.col, hll_reg(v.val) AS r
+                        FROM {db.CUSTOMERS}
+                        CROSS JOIN LATERAL (VALUES {values}) AS v(col, val)
+                        WHERE {_month_where(month, after)} AND v.val IS NOT NULL
+                        OFFSET 0
+                    ) e
+                    GROUP BY 1, 2
+                ) r
+                GROUP BY col
+                ON CONFLICT (month, col) DO UPDATE SET
+                    sketch = hll_merge(d.sketch, EXCLUDED.sketch),
+                    load_id = EXCLUDED.load_id,
+                    through = EXCLUDED.through;
+            """, params)
+            conn.exec_driver_sql(
+                "UPDATE distinct_sketches SET load_id = %(load_id)s, through = %(through)s "
+                "WHERE month = %(month)s;", params)
+        print(f"[distinct] {month}: sketched in {time.perf_counter() - start:.1f}s")
+    return len(todo)
+
+
+def counts(lo=None, hi=None, by_month=True):
+    """
+    Estimated distinct values per column over the stored months in
+    [lo, hi] ('YYYY-MM', None for open): one row per month, or a single
+    row merging the whole range.
+    """
+    where = []
+    if lo:
+        where.append(f"month >= '{pd.Period(lo, freq='M').start_time.date()}'")
+    if hi:
+        where.append(f"month <= '{pd.Period(hi, freq='M').start_time.date()}'")
+    where = f"WHERE {' AND '.join(where)}" if where else ""
+    cols = ", ".join(f"hll_count(hll_union(sketch) FILTER (WHERE col = '{col}')) AS {col}"
+                     for col in COLUMNS)
+    if by_month:
+        return db.query(f"SELECT to_char(month, 'YYYY-MM') AS month, {cols} "
+                        f"FROM distinct_sketches {where} GROUP BY month ORDER BY month;")
+    df = db.query(f"SELECT min(to_char(month, 'YYYY-MM')) AS first, "
+                  f"max(to_char(month, 'YYYY-MM')) AS last, {cols} FROM distinct_sketches {where};")
+    if df["first"].isna().all():
+        return df.iloc[:0][COLUMNS].assign(month=[])[["month"] + COLUMNS]
+    month = df["first"] + " → " + df["last"]
+    return df.drop(columns=["first", "last"]).assign(month=month)[["month"] + COLUMNS]
+
+
+def exact(df):
+    """The same counts with count(DISTINCT ...) over the events (a full scan per month)."""
+    out = []
+    for label in df["month"]:
+        first, _, last = label.partition(" → ")
+        lo, hi = pd.Period(first, freq="M"), pd.Period(last or first, freq="M")
+        where = (f"event_time >= '{lo.start_time.date()} 00:00:00+00' "
+                 f"AND event_time < '{(hi + 1).start_time.date()} 00:00:00+00'")
+        cols = ", ".join(f"count(DISTINCT {col}) AS {col}" for col in COLUMNS)
+        out.append(db.query(f"SELECT {cols} FROM {db.CUSTOMERS} WHERE {where};").iloc[0])
+    return pd.DataFrame(out, index=df.index)
+
+
+def main(lo=None, hi=None, rebuild=False, check=False):
+    built = refresh(rebuild=rebuild)
+    print(f"[✔] {built} month(s) sketched")
+    df = counts(lo, hi, by_month=not (lo or hi))
+    if df.empty:
+        raise SystemExit("No events found in customers table for these months.")
+    if check:
+        true = exact(df)
+        for col in COLUMNS:
+            df[f"{col} exact"] = true[col]
+            df[f"{col} error"] = (df[col] / true[col] - 1).map("{:+.2%}".format)
+    print(f"\nDistinct values (±{STD_ERROR:.1%} one standard error, ±{2 * STD_ERROR:.1%} at 95%):")
+    print(df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distinct users and sessions from HyperLogLog sketches")
+    parser.add_argument("--from", dest="lo", help="first month, YYYY-MM")
+    parser.add_argument("--to", dest="hi", help="last month, YYYY-MM")
+    parser.add_argument("--rebuild", action="store_true", help="sketch every month again")
+    parser.add_argument("--exact", action="store_true",
+                        help="also count exactly, to show the error (scans the events)")
+    args = parser.parse_args()
+    main(args.lo, args.hi, rebuild=args.rebuild, check=args.exact)
@@ -0,0 +1,135 @@
+"""
+Compact dtypes for the customers rows held in memory.
+
+compact() turns the text columns with few distinct values into
+categoricals, downcasts the integer ids to the narrowest type holding
+them and prices to float32 (exact to the cent below PRICE_LIMIT), and
+stores user_session as 16 raw bytes instead of a 36-character string.
+db.prefetch applies it to the purchase rows it keeps, and
+db.purchases hands prices back in float64 (exact_prices), so sums over
+millions of rows keep their precision. Run on its own, this prints the
+footprint of customers before and after.
+
+    python dtypes.py            # purchase rows
+    python dtypes.py --all      # every event
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+CATEGORICAL = ["event_type", "category_code", "brand"]
+INTEGER = ["product_id", "user_id", "category_id", "purchase_count"]
+PRICE = ["event_price", "price", "total_spent"]
+UUID = ["user_session"]
+
+# float32 keeps 24 bits of mantissa; below 2^23 cents (83,886.08) the
+# spacing of float32 values is under half a cent, so rounding the
+# float64 of a float32 price to the cent gives the original price back
+PRICE_LIMIT = 2 ** 23 / 100
+
+# ASCII hex digit -> nibble, as in Day0/ex03/binary_copy.py
+HEX = np.zeros(256, dtype=np.uint8)
+HEX[np.frombuffer(b"0123456789", np.uint8)] = np.arange(10)
+HEX[np.frombuffer(b"abcdef", np.uint8)] = np.arange(10, 16)
+HEX[np.frombuffer(b"ABCDEF", np.uint8)] = np.arange(10, 16)
+
+
+def uuid_bytes(values):
+    """UUID strings (None for NULL) as a pyarrow fixed_size_binary(16) column."""
+    s = pd.Series(values, dtype=object)
+    valid = s.notna().to_numpy()
+    text = s[valid].str.replace("-", "", regex=False).to_numpy(dtype="S32")
+    if len(text) and not (np.char.str_len(text) == 32).all():
+        raise ValueError("user_session holds a value that is not a UUID")
+    digits = HEX[np.frombuffer(text.tobytes(), np.uint8)].reshape(-1, 16, 2)
+    packed = np.zeros((len(s), 16), dtype=np.uint8)
+    packed[valid] = (digits[:, :, 0] << 4) | digits[:, :, 1]
+    mask = pa.array(valid).buffers()[1] if not valid.all() else None
+    arr = pa.FixedSizeBinaryArray.from_buffers(
+        pa.binary(16), len(s), [mask, pa.py_buffer(packed.tobytes())], null_count=int((~valid).sum()))
+    return pd.Series(pd.arrays.ArrowExtensionArray(arr), index=values.index, name=values.name)
+
+
+def uuid_text(values):
+    """The 16-byte user_session column back as canonical UUID strings."""
+    def text(b):
+        if pd.isna(b):
+            return None
+        h = b.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+    return pd.Series([text(b) for b in values], index=values.index, name=values.name, dtype=object)
+
+
+def _downcast_int(values):
+    if values.isna().any():
+        return values
+    return pd.to_numeric(values, downcast="integer")
+
+
+def _cents_round_trip(values):
+    """True when every price comes back unchanged from float32 through exact_prices()."""
+    v = values.to_numpy(dtype="float64")
+    back = v.astype("float32").astype("float64").round(2)
+    return bool(((back == v) | (np.isnan(v) & np.isnan(back))).all())
+
+
+def compact(df):
+    """A copy of df with the known columns in compact dtypes; others are kept."""
+    out = {}
+    for name, values in df.items():
+        if name in CATEGORICAL:
+            values = values.astype("category")
+        elif name in INTEGER and pd.api.types.is_integer_dtype(values):
+            values = _downcast_int(values)
+        elif name in PRICE and pd.api.types.is_float_dtype(values):
+            if not (values.abs() >= PRICE_LIMIT).any() and _cents_round_trip(values):
+                values = values.astype("float32")
+        elif name in UUID and not isinstance(values.dtype, pd.ArrowDtype):
+            values = uuid_bytes(values)
+        out[name] = values
+    return pd.DataFrame(out, index=df.index)
+
+
+def exact_prices(df):
+    """
+    df with its float32 price columns back in float64, rounded to the
+    cent: the exact values compact() started from, for summing.
+    """
+    wide = {name: df[name].astype("float64").round(2) for name in PRICE
+            if name in df.columns and df[name].dtype == "float32"}
+    return df.assign(**wide) if wide else df
+
+
+def footprint(df):
+    """Bytes held by each column, strings and objects included."""
+    return df.memory_usage(deep=True, index=False)
+
+
+def report(before, after):
+    """Print the footprint per column and in total, before and after compact()."""
+    b, a = footprint(before), footprint(after)
+    print(f"{'column':<15} {'before':<22} {'after':<36} {'MB':>8} {'→ MB':>8}")
+    for name in before.columns:
+        print(f"{name:<15} {str(before[name].dtype):<22} {str(after[name].dtype):<36} "
+              f"{b[name] / 2**20:>8.1f} {a[name] / 2**20:>8.1f}")
+    print(f"{'total':<74} {b.sum() / 2**20:>8.1f} {a.sum() / 2**20:>8.1f} "
+          f"({b.sum() / max(a.sum(), 1):.1f}x smaller, {len(before):,} rows)")
+
+
+if __name__ == "__main__":
+    import db
+
+    parser = argparse.ArgumentParser(description="Memory footprint of customers before and after compact()")
+    parser.add_argument("--all", action="store_true", help="every event, not only purchases")
+    args = parser.parse_args()
+    where = "" if args.all else f" WHERE {db.WHERE_PURCHASE}"
+    start = time.perf_counter()
+    df = db.copy_query(f"SELECT * FROM {db.CUSTOMERS}{where};")
+    print(f"[dtypes] {len(df):,} rows loaded in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    small = compact(df)
+    print(f"[dtypes] compacted in {time.perf_counter() - start:.1f}s\n")
+    report(df, small)
@@ -1,58 +1,64 @@
+import argparse
 import os
-import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
-import psycopg2
-import socket
-
-def has_display():
-    """Check if a display is really available (not just DISPLAY env set)."""
-    display = os.environ.get("DISPLAY")
-    if not display:
-        return False
-    # If DISPLAY exists but cannot connect, treat as headless
-    try:
-        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        s.connect(display)
-        s.close()
-        return True
-    except Exception:
-        return False
-
-# --- Detect environment safely ---
-if not has_display():
-    matplotlib.use("Agg")
-    HEADLESS = True
-else:
-    HEADLESS = False
-
-# --- Database connection ---
-conn = psycopg2.connect(
-    host="localhost",
-    dbname="piscineds",
-    user="gtskitis",
-    password="mysecretpassword"
-)
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+import render
+
+HEADLESS = render.HEADLESS
 
 # --- Query ---
-query = """
+query = f"""
 SELECT event_type, COUNT(*) AS count
-FROM customers
+FROM {db.CUSTOMERS}
 GROUP BY event_type
 ORDER BY count DESC;
 """
-df = pd.read_sql_query(query, conn)
-conn.close()
-
-# --- Plot ---
-plt.figure(figsize=(7, 7))
-plt.pie(df["count"], labels=df["event_type"], autopct="%1.1f%%", startangle=140)
-plt.title("User actions on the website")
-
-if HEADLESS:
-    output_path = os.path.join(os.path.dirname(__file__), "pie_chart.png")
-    plt.savefig(output_path)
-    print(f"[✔] No display detected → chart saved as {output_path}")
-else:
-    print("[INFO] Display available → showing chart window.")
-    plt.show()
+
+# the same counts from the monthly rollups (Day2/rollups.sql)
+rollup_query = """
+SELECT event_type, sum(events) AS count
+FROM rollup_monthly
+GROUP BY event_type
+ORDER BY count DESC;
+"""
+
+
+def compute(rollup=False):
+    df = db.query(rollup_query if rollup else query)
+    if rollup and df.empty:
+        raise SystemExit("rollup_monthly is empty: run Day2/rollups.sql first.")
+    return df
+
+
+def pie(fig, df):
+    ax = fig.subplots()
+    ax.pie(df["count"], labels=df["event_type"], autopct="%1.1f%%", startangle=140)
+    ax.set_title("User actions on the website")
+
+
+CHARTS = [
+    render.Chart(os.path.join(os.path.dirname(__file__), "pie_chart.png"), (7, 7), pie,
+                 dpi=None, tight=False),
+]
+
+
+def main(rollup=False):
+    df = compute(rollup)
+
+    # --- Plot ---
+    render.save(CHARTS, df)
+
+    if HEADLESS:
+        print(f"[✔] No display detected → chart saved as {CHARTS[0].path}")
+    else:
+        print("[INFO] Display available → showing chart window.")
+        render.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pie chart of user actions")
+    parser.add_argument("--rollup", action="store_true",
+                        help="count from rollup_monthly instead of scanning customers")
+    main(rollup=parser.parse_args().rollup)
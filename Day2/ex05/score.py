@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+import features
+import segment_model
+
+# Scores the users of user_rfm (Day2/user_rfm.sql) with the model saved
+# by Clustering.py --save-model and upserts them into user_segments.
+# Recency is measured from the reference time stored with the model, so
+# a user scored once keeps a valid label until their user_rfm row
+# changes. Only rows updated after the model's scoring watermark
+# (score_progress) are read, in batches from a server-side cursor; the
+# new watermark is the newest updated_at, read in the same REPEATABLE
+# READ snapshot as the rows, and refresh_user_rfm() stamps its rows in
+# commit order, so a refresh committing during the run is picked up by
+# the next one. A new model version, or --full, rescores everyone.
+
+
+def main(version=None, batch=50_000, full=False):
+    model = segment_model.load(version)
+    version = model["version"]
+    start = time.perf_counter()
+
+    conn = db.engine().raw_connection()
+    try:
+        cur = conn.cursor()
+        # the watermark and the rows read come from one snapshot, taken by
+        # the first query of the transaction
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cur.execute("SELECT max(updated_at) FROM user_rfm;")
+        through = cur.fetchone()[0]
+        if through is None:
+            raise SystemExit("user_rfm is empty: run Day2/user_rfm.sql first.")
+        segment_model.prepare(cur)
+
+        now = model["now"]
+        since = None if full else segment_model.scored_through(cur, version)
+
+        users = conn.cursor(name="score_users")
+        users.itersize = batch
+        users.execute("""
+            SELECT user_id, last_purchase, purchase_count, total_spent::float8
+            FROM user_rfm
+            WHERE updated_at > coalesce(%s::timestamptz, '-infinity') AND updated_at <= %s
+            ORDER BY user_id;
+        """, (since, through))
+
+        scored_users = 0
+        columns = ["user_id", "last_purchase", "purchase_count", "total_spent"]
+        while True:
+            rows = users.fetchmany(batch)
+            if not rows:
+                break
+            totals = pd.DataFrame(rows, columns=columns)
+            totals["last_purchase"] = pd.to_datetime(totals["last_purchase"], utc=True)
+            scored = segment_model.predict(model, features.rfm_from_totals(totals, now))
+            segment_model.write(cur, scored, version)
+            scored_users += len(scored)
+            print(f"   {scored_users:,} users scored")
+        users.close()
+        segment_model.mark_scored(cur, version, through)
+        conn.commit()
+    finally:
+        conn.close()
+
+    what = "all users" if since is None else f"users changed since {since}"
+    print(f"[✔] Model {version}: {scored_users:,} {what} → user_segments "
+          f"in {time.perf_counter() - start:.1f}s (recency from {now:%Y-%m-%d})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign clusters and segments to new or changed users")
+    parser.add_argument("--version", default=None,
+                        help="model version to score with (default: the newest)")
+    parser.add_argument("--batch", type=int, default=50_000,
+                        help="users read and written per batch")
+    parser.add_argument("--full", action="store_true",
+                        help="rescore every user, not just the changed ones")
+    args = parser.parse_args()
+    main(version=args.version, batch=args.batch, full=args.full)
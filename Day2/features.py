@@ -0,0 +1,78 @@
+"""
+Per-user feature builders shared by the clustering charts.
+
+Everything is computed with native groupby reductions (no Python
+callback per user) and returned in compact dtypes: categorical user
+ids, int32 counts and float32 money.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+# recency segments of the clustering charts, most recent first
+SEGMENTS = ["Loyal customers", "New customers", "Inactive"]
+
+
+def rfm(purchases, now=None):
+    """
+    Recency (months since the last purchase), frequency and monetary per
+    user, from purchase rows with event_time, user_id and event_price.
+    now defaults to one day after the last purchase.
+    """
+    users = pd.Categorical(purchases["user_id"])
+    g = purchases.groupby(users, observed=True, sort=True)
+    last = g["event_time"].max()
+    if now is None:
+        now = last.max() + pd.Timedelta(days=1)
+    return pd.DataFrame({
+        "user_id": last.index,
+        "recency": ((now - last).dt.days / 30.0).to_numpy("float32"),
+        "frequency": g["event_time"].count().to_numpy("int32"),
+        "monetary": g["event_price"].sum().to_numpy("float32"),
+    })
+
+
+def rfm_from_totals(totals, now=None):
+    """
+    The same RFM from per-user totals (user_id, last_purchase,
+    purchase_count, total_spent), as stored in user_rfm.
+    """
+    if now is None:
+        now = totals["last_purchase"].max() + pd.Timedelta(days=1)
+    return pd.DataFrame({
+        "user_id": totals["user_id"].to_numpy(),
+        "recency": ((now - totals["last_purchase"]).dt.days / 30.0).to_numpy("float32"),
+        "frequency": totals["purchase_count"].to_numpy("int32"),
+        "monetary": totals["total_spent"].to_numpy("float32"),
+    })
+
+
+def clustering_matrix(rfm):
+    """
+    recency, log frequency and log monetary, the k-means input; rows
+    with NaN or inf are dropped and the rfm index is kept.
+    """
+    X = pd.DataFrame({
+        "recency": rfm["recency"],
+        # ensure no negative values and avoid log of 0 or negative
+        "frequency_log": np.log1p(rfm["frequency"].clip(lower=0)),
+        "monetary_log": np.log1p(rfm["monetary"].clip(lower=0)),
+    })
+    return X.replace([np.inf, -np.inf], np.nan).dropna()
+
+
+def scaled_clustering_matrix(rfm):
+    """
+    clustering_matrix standardized, as k-means is fitted on it:
+    (clustering_matrix, scaled array, fitted StandardScaler). elbow.py
+    and Clustering.py both build their k-means input here, so their
+    fits share kmeans_engine cache keys.
+    """
+    X = clustering_matrix(rfm)
+    scaler = StandardScaler()
+    return X, scaler.fit_transform(X), scaler
+
+
+def segment(recency, q1, q2):
+    """Recency segments, split at the q1 and q2 thresholds (in months)."""
+    return pd.cut(recency, bins=[-np.inf, q1, q2, np.inf], labels=SEGMENTS)
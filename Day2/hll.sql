@@ -0,0 +1,59 @@
+-- HyperLogLog distinct counts in plain SQL, for the rollup tables of
+-- rollups.sql and the monthly distinct sketches of distinct.py.
+-- A sketch is a sorted int[] of the non-empty registers, each packed as
+-- register index << 8 | rank: 2^12 registers at most (16 KB), so a
+-- count is within 1.04 / sqrt(4096) = 1.6% (one standard error), and
+-- sketches of disjoint or overlapping sets merge by keeping the
+-- highest rank per register.
+-- Building one: compute r = hll_reg(value::text) once per row in a
+-- subquery, GROUP BY the keys and r >> 8 with max(r & 255), then
+-- array_agg((r >> 8) << 8 | rank ORDER BY r >> 8) per key.
+-- Merging: hll_union(sketch). Counting: hll_count(sketch).
+
+-- packed register of one value: the top 12 bits of its 64-bit hash pick
+-- the register, the position of the first 1 in the other 52 the rank.
+-- A single expression with no FROM and no STRICT, so the planner
+-- inlines it into the calling query instead of making a function call
+-- per row; NULL still gives NULL.
+CREATE OR REPLACE FUNCTION hll_reg(v text)
+RETURNS int AS $$
+    SELECT (((hashtextextended(v, 0) >> 52) & 4095)::int << 8)
+           | coalesce(nullif(position('1' IN (hashtextextended(v, 0) & 4503599627370495)::bit(52)::text), 0), 53)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION hll_merge(a int[], b int[])
+RETURNS int[] AS $$
+    SELECT coalesce(array_agg(idx << 8 | rank ORDER BY idx), '{}')
+    FROM (
+        SELECT r >> 8 AS idx, max(r & 255) AS rank
+        FROM unnest(a || b) AS r
+        GROUP BY 1
+    ) s
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+
+CREATE OR REPLACE AGGREGATE hll_union(int[]) (
+    SFUNC = hll_merge,
+    STYPE = int[],
+    INITCOND = '{}',
+    COMBINEFUNC = hll_merge,
+    PARALLEL = SAFE
+);
+
+-- estimate with the small-range (linear counting) correction; the
+-- 64-bit hash needs no large-range one
+CREATE OR REPLACE FUNCTION hll_count(sketch int[])
+RETURNS bigint AS $$
+    SELECT round(CASE
+        WHEN raw <= 2.5 * 4096 AND zeros > 0 THEN 4096 * ln(4096.0 / zeros)
+        ELSE raw
+    END)::bigint
+    FROM (
+        SELECT 0.7213 / (1 + 1.079 / 4096) * 4096 * 4096
+                   / (zeros + coalesce(total, 0)) AS raw,
+               zeros
+        FROM (
+            SELECT 4096 - count(*) AS zeros, sum(power(2.0, -(r & 255))) AS total
+            FROM unnest(sketch) AS r
+        ) s
+    ) e
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
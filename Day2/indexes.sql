@@ -0,0 +1,22 @@
+-- Schema step for the Day2 analytics queries, run once after Day1.
+-- event_type is normalized to lower case (automatic_table.py already
+-- loads it that way), so the charts filter with event_type = 'purchase'
+-- instead of lower(event_type) = 'purchase', and a partial covering
+-- index over the purchase rows answers those queries without touching
+-- the other event types.
+
+\ir ../Day0/ex02/load_marks.sql
+
+UPDATE customers
+SET event_type = lower(event_type)
+WHERE event_type <> lower(event_type);
+
+DO $$
+BEGIN
+    EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS customers_purchase_idx ON customers (event_time, user_id) INCLUDE (%I) WHERE event_type = %L',
+        customers_price_col(), 'purchase');
+END;
+$$;
+
+VACUUM ANALYZE customers;
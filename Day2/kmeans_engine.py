@@ -0,0 +1,179 @@
+"""
+K-means fits for the elbow sweep and the clustering charts.
+
+sweep() fits every k of an elbow search in parallel across cores, or
+one after another when each k warm-starts from the previous centroids.
+mode="minibatch" and sample=N keep it usable with tens of millions of
+users; inertia is still measured on the whole feature matrix.
+
+Every fit is cached on disk as its centroids and inertia (not the
+model, whose labels_ grow with the users), under a key made of a hash
+of the feature matrix and the fit parameters. Reruns of elbow.py, and
+Clustering.py fitting a k the sweep already fitted on the same
+features (elbow.py --features rfm, both through
+features.scaled_clustering_matrix), load them instead of refitting.
+The least recently used entries are removed once the cache passes
+KMEANS_CACHE_MB (default 64). KMEANS_CACHE moves it (default
+~/.cache/piscine-ds/kmeans).
+"""
+import hashlib
+import os
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin_min
+
+CACHE = os.environ.get("KMEANS_CACHE",
+                       os.path.join(os.path.expanduser("~"), ".cache", "piscine-ds", "kmeans"))
+MAX_BYTES = int(float(os.environ.get("KMEANS_CACHE_MB", 64)) * 2 ** 20)
+SEED = 42
+
+
+def feature_hash(X):
+    """Content hash of a feature matrix: shape, dtype and values."""
+    X = np.ascontiguousarray(X)
+    h = hashlib.sha256(f"{X.shape}{X.dtype}".encode())
+    h.update(X.data)
+    return h.hexdigest()
+
+
+def _key(features, k, mode, sample, warm):
+    text = f"{features}|k={k}|{mode}|sample={sample}|warm={warm}|seed={SEED}|{sklearn.__version__}"
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def _path(key):
+    return os.path.join(CACHE, f"{key}.joblib")
+
+
+def _load(key):
+    try:
+        entry = joblib.load(_path(key))
+        os.utime(_path(key))
+    except (OSError, EOFError, ValueError):
+        return None
+    return entry if isinstance(entry, dict) and "centers" in entry else None
+
+
+def _evict():
+    entries = []
+    for name in os.listdir(CACHE):
+        if name.endswith(".joblib"):
+            try:
+                st = os.stat(os.path.join(CACHE, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(CACHE, name))
+        except OSError:
+            pass
+        total -= size
+
+
+def _store(key, entry):
+    if MAX_BYTES <= 0:
+        return
+    os.makedirs(CACHE, exist_ok=True)
+    tmp = _path(key) + f".{os.getpid()}.tmp"
+    joblib.dump(entry, tmp)
+    os.replace(tmp, _path(key))
+    _evict()
+
+
+def _model(entry):
+    """
+    A KMeans predicting with the cached centroids: fitted on the
+    centroids themselves, one per cluster, so one Lloyd step leaves
+    them exactly as they are.
+    """
+    centers = entry["centers"]
+    model = KMeans(n_clusters=len(centers), init=centers, n_init=1, max_iter=1).fit(centers)
+    model.inertia_ = entry["inertia"]
+    return model
+
+
+def _sample(X, sample):
+    if not sample or sample >= len(X):
+        return X
+    rng = np.random.default_rng(SEED)
+    return X[np.sort(rng.choice(len(X), sample, replace=False))]
+
+
+def _grow(X, centers, rng):
+    """centers plus one more point drawn k-means++ style (D² weighting)."""
+    _, dist = pairwise_distances_argmin_min(X, centers)
+    weights = dist ** 2
+    total = weights.sum()
+    i = rng.choice(len(X), p=weights / total) if total > 0 else rng.integers(len(X))
+    return np.vstack([centers, X[i]])
+
+
+def _fit(X, k, mode, sample, init=None):
+    """Fit one model on X (or a sample of it); inertia is over all of X."""
+    params = {"n_clusters": k, "random_state": SEED}
+    if init is not None:
+        params.update(init=init, n_init=1)
+    else:
+        params["n_init"] = "auto"
+    if mode == "minibatch":
+        model = MiniBatchKMeans(batch_size=4096, **params)
+    else:
+        model = KMeans(**params)
+    train = _sample(X, sample)
+    model.fit(train)
+    inertia = model.inertia_ if train is X else -model.score(X)
+    return {"centers": model.cluster_centers_, "inertia": float(inertia)}
+
+
+def fit(X, k, mode="full", sample=None):
+    """A k-means model for k clusters, rebuilt from the cached centroids when available."""
+    X = np.asarray(X, dtype=float)
+    key = _key(feature_hash(X), k, mode, sample, warm=False)
+    entry = _load(key)
+    if entry is None:
+        entry = _fit(X, k, mode, sample)
+        _store(key, entry)
+    return _model(entry)
+
+
+def sweep(X, k_values, mode="full", sample=None, warm_start=False, workers=-1):
+    """
+    Inertia for every k in k_values, as a list in the same order.
+    Cached ks are loaded; the rest are fitted in parallel on `workers`
+    processes, or in order of k with warm_start, each seeded with the
+    previous k's centroids plus one new k-means++ pick.
+    """
+    X = np.asarray(X, dtype=float)
+    features = feature_hash(X)
+    k_values = list(k_values)
+    keys = {k: _key(features, k, mode, sample, warm_start) for k in k_values}
+    entries = {k: _load(keys[k]) for k in k_values}
+
+    if warm_start:
+        rng = np.random.default_rng(SEED)
+        train = _sample(X, sample)
+        centers = None
+        for k in sorted(k_values):
+            if entries[k] is None:
+                init = None
+                if centers is not None and len(centers) == k - 1:
+                    init = _grow(train, centers, rng)
+                entries[k] = _fit(X, k, mode, sample, init=init)
+                _store(keys[k], entries[k])
+            centers = entries[k]["centers"]
+    else:
+        missing = [k for k in k_values if entries[k] is None]
+        fitted = joblib.Parallel(n_jobs=workers)(
+            joblib.delayed(_fit)(X, k, mode, sample) for k in missing)
+        for k, entry in zip(missing, fitted):
+            entries[k] = entry
+            _store(keys[k], entry)
+
+    return [entries[k]["inertia"] for k in k_values]
@@ -0,0 +1,142 @@
+"""
+Out-of-core clustering over the user_rfm table.
+
+Users are streamed from a named (server-side) cursor in batches of a
+fixed size, so client memory is bounded by the batch and not by the
+number of customers. Fits use partial_fit: StandardScaler on a first
+pass, then MiniBatchKMeans and IncrementalPCA on a second; labels are
+assigned by a further pass. The recency reference and the segment
+thresholds are computed in Postgres.
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+
+import db
+import features
+import segment_model
+
+BATCH = 100_000
+SEED = 42
+
+TOTALS = ["user_id", "last_purchase", "purchase_count", "total_spent"]
+_cursors = itertools.count()
+
+
+def batches(batch=BATCH):
+    """user_rfm rows as DataFrames of at most batch users each."""
+    conn = db.engine().raw_connection()
+    try:
+        cur = conn.cursor(name=f"user_rfm_stream_{next(_cursors)}")
+        cur.itersize = batch
+        cur.execute("SELECT user_id, last_purchase, purchase_count, total_spent::float8 "
+                    "FROM user_rfm ORDER BY user_id;")
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            df = pd.DataFrame(rows, columns=TOTALS)
+            df["last_purchase"] = pd.to_datetime(df["last_purchase"], utc=True)
+            yield df
+        cur.close()
+    finally:
+        conn.close()
+
+
+def reference():
+    """
+    The recency reference (a day after the newest purchase) and the
+    1/3 and 4/5 recency quantiles Clustering.py splits segments at,
+    on the float32 recency values features.rfm_from_totals produces.
+    """
+    with db.engine().connect() as conn:
+        now = conn.exec_driver_sql(
+            "SELECT max(last_purchase) + interval '1 day' FROM user_rfm;").scalar()
+        if now is None:
+            raise SystemExit("user_rfm is empty: run Day2/user_rfm.sql first.")
+        q = conn.exec_driver_sql("""
+            SELECT percentile_cont(ARRAY[1/3::float8, 4/5::float8]) WITHIN GROUP (ORDER BY recency)
+            FROM (
+                SELECT (floor(extract(epoch FROM %(now)s - last_purchase) / 86400) / 30)::float4::float8
+                       AS recency
+                FROM user_rfm
+            ) r;
+        """, {"now": now}).scalar()
+    return pd.Timestamp(now), tuple(q)
+
+
+def matrix(totals, now):
+    return features.clustering_matrix(features.rfm_from_totals(totals, now))
+
+
+def fit(k=5, batch=BATCH, n_components=2):
+    """Scaler, k-means and PCA fitted in two streaming passes; a segment_model dict."""
+    now, thresholds = reference()
+
+    scaler = StandardScaler()
+    for totals in batches(batch):
+        scaler.partial_fit(matrix(totals, now))
+
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=SEED, batch_size=min(batch, 4096))
+    pca = IncrementalPCA(n_components=n_components)
+    seen = 0
+    for totals in batches(batch):
+        X_scaled = scaler.transform(matrix(totals, now))
+        if not seen and len(X_scaled) < k:
+            raise SystemExit(f"Need at least {k} users in the first batch to seed {k} clusters.")
+        seen += len(X_scaled)
+        kmeans.partial_fit(X_scaled)
+        # IncrementalPCA cannot take a batch smaller than its components
+        if len(X_scaled) >= n_components:
+            pca.partial_fit(X_scaled)
+
+    return {"scaler": scaler, "kmeans": kmeans, "pca": pca,
+            "thresholds": thresholds, "now": now, "n_users": seen}
+
+
+def label(model, batch=BATCH):
+    """
+    Streaming labeling pass: yields each batch's RFM rows with their
+    cluster, segment and PCA coordinates.
+    """
+    for totals in batches(batch):
+        rfm = features.rfm_from_totals(totals, model["now"])
+        scored = segment_model.predict(model, rfm, project=True)
+        yield rfm.loc[scored.index].join(scored.drop(columns="user_id"))
+
+
+def sweep(columns, k_values, batch=BATCH, scale=False):
+    """
+    Elbow inertias with one MiniBatchKMeans per k, all fed by the same
+    streaming pass, then summed over a second pass. columns(totals)
+    builds the feature matrix of a batch.
+    """
+    scaler = None
+    if scale:
+        scaler = StandardScaler()
+        for totals in batches(batch):
+            scaler.partial_fit(columns(totals))
+
+    def features_of(totals):
+        X = columns(totals)
+        return scaler.transform(X) if scaler is not None else np.asarray(X, dtype=float)
+
+    models = {k: MiniBatchKMeans(n_clusters=k, random_state=SEED, batch_size=min(batch, 4096))
+              for k in k_values}
+    for totals in batches(batch):
+        X = features_of(totals)
+        for k, model in models.items():
+            if not hasattr(model, "cluster_centers_") and len(X) < k:
+                continue
+            model.partial_fit(X)
+
+    inertias = dict.fromkeys(k_values, 0.0)
+    for totals in batches(batch):
+        X = features_of(totals)
+        for k, model in models.items():
+            inertias[k] -= model.score(X)
+    return [inertias[k] for k in k_values]
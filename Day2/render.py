@@ -0,0 +1,104 @@
+"""
+Chart rendering shared by the Day2 scripts.
+
+The display is probed once, here, and the backend chosen before
+pyplot is imported. Each script lists its charts in CHARTS: the output
+file, the figure size and a function drawing into a matplotlib Figure
+from the script's precomputed data. Run on its own, a script saves
+them through pyplot figures, so a display can still show them;
+report.py renders every chart in a process pool on plain Figure
+objects, with no pyplot state: one task per script, so its data is
+sent to a worker once and not once per chart.
+"""
+import importlib.util
+import os
+import socket
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+
+def has_display() -> bool:
+    """Check if a display is really available (not just DISPLAY env set)."""
+    d = os.environ.get("DISPLAY")
+    if not d:
+        return False
+    # If DISPLAY exists but cannot connect, treat as headless
+    try:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(d)
+        s.close()
+        return True
+    except Exception:
+        return False
+
+
+# Backend setup (headless mode for WSL)
+if not has_display():
+    matplotlib.use("Agg")
+    HEADLESS = True
+else:
+    HEADLESS = False
+
+import matplotlib.pyplot as plt  # noqa: E402  (after the backend is chosen)
+from matplotlib.figure import Figure  # noqa: E402
+
+DPI = 120
+
+# dpi=None keeps matplotlib's default; tight applies tight_layout() before saving
+Chart = namedtuple("Chart", ["path", "figsize", "draw", "dpi", "tight"], defaults=[DPI, True])
+
+_modules = {}
+
+
+def load(path):
+    """Import a chart script by path without running its __main__ block."""
+    if path not in _modules:
+        name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[path] = module
+    return _modules[path]
+
+
+def _finish(fig, chart):
+    if chart.tight:
+        fig.tight_layout()
+    fig.savefig(chart.path, dpi=chart.dpi)
+
+
+def save(charts, data):
+    """Draw charts on pyplot figures and save them (script mode)."""
+    for chart in charts:
+        fig = plt.figure(figsize=chart.figsize)
+        chart.draw(fig, data)
+        _finish(fig, chart)
+
+
+def show():
+    plt.show()
+
+
+def _render(script, data):
+    """Draw and save every chart of one script; (output path, seconds) per chart."""
+    done = []
+    for chart in load(script).CHARTS:
+        start = time.perf_counter()
+        fig = Figure(figsize=chart.figsize)
+        chart.draw(fig, data)
+        _finish(fig, chart)
+        done.append((os.path.abspath(chart.path), time.perf_counter() - start))
+    return done
+
+
+def render_all(tasks, workers=None):
+    """
+    Render (script path, data) tasks in a process pool, one per script;
+    returns (output path, seconds) per chart, in task and CHARTS order.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render, *task) for task in tasks]
+        return [done for f in futures for done in f.result()]
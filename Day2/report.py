@@ -0,0 +1,88 @@
+"""
+Run every Day2 chart in one process, and render them in parallel.
+
+Each script's compute() runs first, in this process. The purchase
+rows are fetched once, with the union of the columns the charts
+declare in COLUMNS, and every chart reads its projection from memory:
+one scan of customers for the purchase charts instead of five. The
+charts those aggregates feed are then rendered by render.render_all in
+a pool of worker processes on plain Figure objects, and the time each
+one took is reported. Charts are written to the current directory, as
+when run one by one.
+
+With --sql the charts that can aggregate in Postgres do so, with
+--rfm-table the clustering charts read user_rfm, with --sketch the
+boxplots render from quantile sketches, with --rollup the pie and the
+monthly charts read the rollup tables; only the remaining ones share
+the prefetched rows.
+"""
+import argparse
+import inspect
+import os
+import time
+
+import db
+import dtypes
+import render
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPTS = [
+    "ex00/pie.py",
+    "ex01/chart.py",
+    "ex02/mustache.py",
+    "ex03/Building.py",
+    "ex04/elbow.py",
+    "ex05/Clustering.py",
+]
+
+
+def options(module, flags):
+    """The flags set in flags that this chart's compute() understands."""
+    params = inspect.signature(module.compute).parameters
+    return {name: True for name, on in flags.items() if on and name in params}
+
+
+def main(sql=False, rfm_table=False, sketch=False, rollup=False, workers=None):
+    flags = {"sql": sql, "rfm_table": rfm_table, "sketch": sketch, "rollup": rollup}
+    paths = [os.path.join(HERE, script) for script in SCRIPTS]
+    modules = [render.load(path) for path in paths]
+    wall = time.perf_counter()
+
+    columns = [c for m in modules if not options(m, flags) for c in getattr(m, "COLUMNS", [])]
+    if columns:
+        start = time.perf_counter()
+        rows = db.prefetch(columns)
+        print(f"[report] purchase rows loaded once in {time.perf_counter() - start:.1f}s "
+              f"({len(rows):,} rows, {dtypes.footprint(rows).sum() / 2**20:.1f} MB)")
+
+    tasks = []
+    for script, path, module in zip(SCRIPTS, paths, modules):
+        start = time.perf_counter()
+        data = module.compute(**options(module, flags))
+        print(f"[report] {script}: aggregates in {time.perf_counter() - start:.1f}s")
+        tasks.append((path, data))
+
+    start = time.perf_counter()
+    rendered = render.render_all(tasks, workers)
+    print(f"\n[✔] {len(rendered)} charts rendered in {time.perf_counter() - start:.1f}s "
+          f"({time.perf_counter() - wall:.1f}s in total):")
+    for path, seconds in rendered:
+        print(f"   {seconds:6.2f}s  {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every Day2 chart")
+    parser.add_argument("--sql", action="store_true",
+                        help="let charts that support it aggregate in Postgres")
+    parser.add_argument("--rfm-table", action="store_true",
+                        help="let the clustering charts read user_rfm")
+    parser.add_argument("--sketch", action="store_true",
+                        help="let the boxplots render from quantile sketches")
+    parser.add_argument("--rollup", action="store_true",
+                        help="let the pie and monthly charts read the rollup tables")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="rendering processes (default: one per core)")
+    args = parser.parse_args()
+    main(sql=args.sql, rfm_table=args.rfm_table, sketch=args.sketch, rollup=args.rollup,
+         workers=args.workers)
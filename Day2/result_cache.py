@@ -0,0 +1,129 @@
+"""
+On-disk cache of query results, as Parquet files.
+
+A result is stored under a key made of the query text, its options and
+a fingerprint of every table the query names: the tables behind a
+view, and every partition of a partitioned table, are followed. The
+fingerprint reads the catalog and the statistics collector only
+(storage file, reltuples, rows inserted, updated and deleted), so it
+costs a few milliseconds whatever the table size; any load, dedup or
+refresh changes it and the next run queries Postgres again. A write
+shows up in the counters once its session commits, within a second or
+so. Queries naming no known table are not cached.
+
+The cache is bounded: files are touched on every hit, and the least
+recently used ones are removed once the total passes RESULT_CACHE_MB
+(default 1024; 0 turns the cache off). RESULT_CACHE moves it (default
+~/.cache/piscine-ds/results).
+"""
+import hashlib
+import os
+import re
+
+import pandas as pd
+
+CACHE = os.environ.get("RESULT_CACHE",
+                       os.path.join(os.path.expanduser("~"), ".cache", "piscine-ds", "results"))
+MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MB", 1024)) * 2 ** 20)
+
+_relations = None
+
+FINGERPRINT = """
+WITH RECURSIVE rel(oid) AS (
+    SELECT c.oid FROM pg_class c
+    WHERE c.relname = ANY(%(names)s) AND pg_table_is_visible(c.oid)
+    UNION
+    -- a view depends on the relations its rewrite rule reads
+    SELECT d.refobjid
+    FROM rel
+    JOIN pg_rewrite w ON w.ev_class = rel.oid
+    JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = w.oid
+                    AND d.refclassid = 'pg_class'::regclass AND d.refobjid <> rel.oid
+)
+SELECT c.relname, c.relfilenode, c.reltuples,
+       coalesce(s.n_tup_ins, 0), coalesce(s.n_tup_upd, 0), coalesce(s.n_tup_del, 0)
+FROM rel
+-- pg_partition_tree() has no rows for a plain table
+CROSS JOIN LATERAL (SELECT rel.oid UNION SELECT relid FROM pg_partition_tree(rel.oid)) p(relid)
+JOIN pg_class c ON c.oid = p.relid
+LEFT JOIN pg_stat_user_tables s ON s.relid = p.relid
+WHERE c.relkind IN ('r', 'p', 'm')
+ORDER BY c.oid;
+"""
+
+
+def _names(conn):
+    """Tables, views and materialized views a query can name (process-wide)."""
+    global _relations
+    if _relations is None:
+        _relations = [name for (name,) in conn.exec_driver_sql(
+            "SELECT relname FROM pg_class WHERE relkind IN ('r', 'p', 'v', 'm') "
+            "AND NOT relispartition AND pg_table_is_visible(oid);").all()]
+    return _relations
+
+
+def fingerprint(conn, sql):
+    """Version of the tables sql reads, or None when it names none."""
+    names = [n for n in _names(conn) if re.search(rf"\b{re.escape(n)}\b", sql)]
+    if not names:
+        return None
+    rows = conn.exec_driver_sql(FINGERPRINT, {"names": names}).all()
+    return repr([tuple(row) for row in rows])
+
+
+def _path(key):
+    return os.path.join(CACHE, f"{key}.parquet")
+
+
+def _evict():
+    entries = []
+    for name in os.listdir(CACHE):
+        if name.endswith(".parquet"):
+            try:
+                st = os.stat(os.path.join(CACHE, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(CACHE, name))
+        except OSError:
+            pass
+        total -= size
+
+
+def fetch(conn, sql, options, run):
+    """
+    The DataFrame run() returns for sql, from the cache when the tables
+    it reads have not changed since it was stored. options are the
+    read_sql_query arguments, part of the key.
+    """
+    if MAX_BYTES <= 0:
+        return run()
+    version = fingerprint(conn, sql)
+    if version is None:
+        return run()
+    text = f"{sql}|{sorted(options.items())!r}|{version}|{pd.__version__}"
+    path = _path(hashlib.sha256(text.encode()).hexdigest()[:32])
+    try:
+        df = pd.read_parquet(path)
+        os.utime(path)
+        return df
+    except (OSError, ValueError):
+        pass
+
+    df = run()
+    tmp = path + f".{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE, exist_ok=True)
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+        _evict()
+    except (OSError, ValueError, TypeError):
+        # a result Parquet cannot hold is simply not cached
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return df
@@ -0,0 +1,212 @@
+-- Daily and monthly rollups of customers for pie.py and chart.py, per
+-- event_type, category_code and brand: events, purchases, revenue of
+-- the purchases, and a HyperLogLog sketch of the distinct users
+-- (hll.sql), so distinct users of any set of days or groups is
+-- hll_count(hll_union(users)) without reading events.
+-- refresh_rollups() recomputes only the days of the tables loaded since
+-- its last run, found from their load marks (Day0/ex02/load_marks.sql):
+-- for a new, reloaded or late-attached month, or a table taken out of
+-- customers, the whole UTC days it covered before and covers now, read
+-- through a BRIN index on event_time, then the months those days fall
+-- in, from rollup_daily.
+-- A dedup deletes rows without a new load mark, so name its days:
+-- SELECT refresh_rollups('2022-11-01', '2022-11-30');
+-- SELECT rebuild_rollups() starts over.
+-- category_code and brand come from customers after fusion.sql, and
+-- from items_dim (fusion_view.sql) when customers is the partitioned
+-- table without them.
+-- Run (from Day2/): psql -f rollups.sql
+
+\ir hll.sql
+\ir ../Day0/ex02/load_marks.sql
+
+-- a few pages per 128 blocks: enough to find a day of a table loaded in time order
+CREATE INDEX IF NOT EXISTS customers_event_time_brin ON customers USING brin (event_time);
+
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    day DATE NOT NULL,
+    event_type VARCHAR(20),
+    category_code TEXT,
+    brand VARCHAR(50),
+    events BIGINT NOT NULL,
+    purchases BIGINT NOT NULL,
+    revenue NUMERIC(16,2) NOT NULL,
+    users INT[] NOT NULL,
+    UNIQUE NULLS NOT DISTINCT (day, event_type, category_code, brand)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_monthly (
+    month DATE NOT NULL,
+    event_type VARCHAR(20),
+    category_code TEXT,
+    brand VARCHAR(50),
+    events BIGINT NOT NULL,
+    purchases BIGINT NOT NULL,
+    revenue NUMERIC(16,2) NOT NULL,
+    users INT[] NOT NULL,
+    UNIQUE NULLS NOT DISTINCT (month, event_type, category_code, brand)
+);
+
+-- each relation of customers as last rolled up: its load_id then and
+-- the UTC days its rows covered
+CREATE TABLE IF NOT EXISTS rollup_loads (
+    table_name TEXT PRIMARY KEY,
+    load_id BIGINT,
+    first_day DATE,
+    last_day DATE
+);
+
+-- recompute the days lo..hi and the months they fall in
+CREATE OR REPLACE FUNCTION rollup_days(lo date, hi date)
+RETURNS bigint AS $$
+DECLARE
+    source text := 'customers';
+BEGIN
+    -- the partitioned customers leaves the item columns to items_dim
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'customers'
+          AND column_name = 'category_code'
+    ) THEN
+        IF to_regclass('items_dim') IS NULL THEN
+            RAISE EXCEPTION 'customers has no category_code and items_dim is missing: run Day1/ex03/fusion.sql or fusion_view.sql first';
+        END IF;
+        source := 'customers LEFT JOIN items_dim USING (product_id)';
+    END IF;
+
+    DELETE FROM rollup_daily WHERE day BETWEEN lo AND hi;
+    EXECUTE format($q$
+        INSERT INTO rollup_daily
+            (day, event_type, category_code, brand, events, purchases, revenue, users)
+        SELECT day, event_type, category_code, brand,
+               sum(events), sum(purchases), sum(revenue),
+               coalesce(array_agg(reg << 8 | rank ORDER BY reg) FILTER (WHERE reg IS NOT NULL), '{}')
+        FROM (
+            -- one row per group and HLL register: its counts and highest rank
+            SELECT day, event_type, category_code, brand,
+                   r >> 8 AS reg,
+                   max(r & 255) AS rank,
+                   count(*) AS events,
+                   count(*) FILTER (WHERE event_type = 'purchase') AS purchases,
+                   coalesce(sum(price) FILTER (WHERE event_type = 'purchase'), 0) AS revenue
+            FROM (
+                -- r once per row: OFFSET 0 keeps the planner from folding
+                -- this into the query above, which would hash again per use
+                SELECT (event_time AT TIME ZONE 'UTC')::date AS day,
+                       event_type, category_code, brand, %1$I AS price,
+                       hll_reg(user_id::text) AS r
+                FROM %2$s
+                WHERE event_time >= $1::timestamp AT TIME ZONE 'UTC'
+                  AND event_time < ($2 + 1)::timestamp AT TIME ZONE 'UTC'
+                OFFSET 0
+            ) e
+            GROUP BY 1, 2, 3, 4, 5
+        ) r
+        GROUP BY day, event_type, category_code, brand
+    $q$, customers_price_col(), source) USING lo, hi;
+
+    DELETE FROM rollup_monthly
+    WHERE month BETWEEN date_trunc('month', lo)::date AND date_trunc('month', hi)::date;
+    INSERT INTO rollup_monthly
+        (month, event_type, category_code, brand, events, purchases, revenue, users)
+    SELECT date_trunc('month', day)::date, event_type, category_code, brand,
+           sum(events), sum(purchases), sum(revenue), hll_union(users)
+    FROM rollup_daily
+    WHERE day >= date_trunc('month', lo)::date
+      AND day < (date_trunc('month', hi) + interval '1 month')::date
+    GROUP BY 1, 2, 3, 4;
+
+    ANALYZE rollup_daily;
+    ANALYZE rollup_monthly;
+    RETURN hi - lo + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_rollups(from_day date DEFAULT NULL, to_day date DEFAULT NULL)
+RETURNS bigint AS $$
+DECLARE
+    r record;
+    now_first date;
+    now_last date;
+    days bigint := 0;
+BEGIN
+    IF from_day IS NOT NULL THEN
+        IF to_day IS NULL THEN
+            SELECT (max(event_time) AT TIME ZONE 'UTC')::date INTO to_day FROM customers;
+        END IF;
+        RETURN CASE WHEN to_day IS NULL THEN 0 ELSE rollup_days(from_day, to_day) END;
+    END IF;
+
+    -- the marks as of now: a load committing during the run is redone next time
+    DROP TABLE IF EXISTS rollup_current;
+    CREATE TEMP TABLE rollup_current AS
+    SELECT rel::text AS table_name, load_id, NULL::date AS first_day, NULL::date AS last_day
+    FROM customers_loads();
+
+    DROP TABLE IF EXISTS rollup_ranges;
+    CREATE TEMP TABLE rollup_ranges (lo date, hi date);
+    FOR r IN
+        SELECT n.table_name, o.first_day, o.last_day
+        FROM rollup_current n
+        LEFT JOIN rollup_loads o USING (table_name)
+        WHERE o.table_name IS NULL OR o.load_id IS DISTINCT FROM n.load_id
+    LOOP
+        EXECUTE format(
+            'SELECT (min(event_time) AT TIME ZONE ''UTC'')::date, (max(event_time) AT TIME ZONE ''UTC'')::date FROM %s',
+            r.table_name)
+        INTO now_first, now_last;
+        RAISE NOTICE 'rollups: % was loaded since the last run', r.table_name;
+        UPDATE rollup_current SET first_day = now_first, last_day = now_last
+        WHERE table_name = r.table_name;
+        -- the days it covered before, which may now be empty, and covers now
+        INSERT INTO rollup_ranges
+        SELECT v.lo, v.hi FROM (VALUES (r.first_day, r.last_day), (now_first, now_last)) v(lo, hi)
+        WHERE v.lo IS NOT NULL;
+    END LOOP;
+
+    UPDATE rollup_current n
+    SET first_day = o.first_day, last_day = o.last_day
+    FROM rollup_loads o
+    WHERE o.table_name = n.table_name AND o.load_id IS NOT DISTINCT FROM n.load_id;
+    -- a table taken out of customers leaves its days empty
+    INSERT INTO rollup_ranges
+    SELECT o.first_day, o.last_day
+    FROM rollup_loads o
+    WHERE o.first_day IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM rollup_current n WHERE n.table_name = o.table_name);
+
+    FOR r IN
+        -- runs of consecutive days, each recomputed once
+        SELECT min(day) AS lo, max(day) AS hi
+        FROM (
+            SELECT day, day - (row_number() OVER (ORDER BY day))::int AS run
+            FROM (
+                SELECT DISTINCT generate_series(lo, hi, interval '1 day')::date AS day
+                FROM rollup_ranges
+            ) d
+        ) g
+        GROUP BY run
+        ORDER BY 1
+    LOOP
+        days := days + rollup_days(r.lo, r.hi);
+    END LOOP;
+
+    -- the loads marked so far are accounted for
+    DELETE FROM rollup_loads;
+    INSERT INTO rollup_loads SELECT * FROM rollup_current;
+    DROP TABLE rollup_current;
+    DROP TABLE rollup_ranges;
+    RETURN days;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rebuild_rollups()
+RETURNS bigint AS $$
+BEGIN
+    TRUNCATE rollup_daily, rollup_monthly;
+    DELETE FROM rollup_loads;
+    RETURN refresh_rollups();
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_rollups() AS days_refreshed;
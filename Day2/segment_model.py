@@ -0,0 +1,141 @@
+"""
+Versioned customer segmentation model.
+
+Clustering.py --save-model stores the fitted StandardScaler, KMeans
+and PCA with the recency thresholds of its segments as one joblib
+artifact, named after the UTC time it was saved; LATEST names the
+newest one. The artifact also keeps the time recency was measured from
+(now), so every later scoring run with it measures recency from the
+same point and the labels of users left untouched stay valid.
+ex05/score.py loads it to cluster new or changed users without
+refitting. SEGMENT_MODELS moves the store (default
+~/.cache/piscine-ds/models). Scores are kept in user_segments, and
+score_progress holds, per model version, the newest user_rfm.updated_at
+already scored.
+"""
+import io
+import os
+from datetime import datetime, timezone
+
+import joblib
+import pandas as pd
+import sklearn
+
+import features
+
+MODELS = os.environ.get("SEGMENT_MODELS",
+                        os.path.join(os.path.expanduser("~"), ".cache", "piscine-ds", "models"))
+LATEST = os.path.join(MODELS, "LATEST")
+
+SEGMENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS user_segments (
+    user_id BIGINT PRIMARY KEY,
+    cluster SMALLINT NOT NULL,
+    segment TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    scored_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS score_progress (
+    model_version TEXT PRIMARY KEY,
+    scored_through TIMESTAMPTZ NOT NULL
+);
+"""
+
+
+def save(scaler, kmeans, pca, thresholds, n_users, now):
+    """Store a fitted model and the recency reference it was fitted at; returns its version."""
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    artifact = {
+        "version": version,
+        "scaler": scaler,
+        "kmeans": kmeans,
+        "pca": pca,
+        "thresholds": tuple(float(t) for t in thresholds),
+        "now": pd.Timestamp(now),
+        "n_users": int(n_users),
+        "sklearn": sklearn.__version__,
+    }
+    os.makedirs(MODELS, exist_ok=True)
+    joblib.dump(artifact, os.path.join(MODELS, f"segments-{version}.joblib"))
+    tmp = f"{LATEST}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, LATEST)
+    return version
+
+
+def load(version=None):
+    """A saved model, the newest one unless a version is given."""
+    if version is None:
+        try:
+            with open(LATEST) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            raise SystemExit(f"No saved model in {MODELS}: run Clustering.py --save-model first.")
+    path = os.path.join(MODELS, f"segments-{version}.joblib")
+    if not os.path.exists(path):
+        raise SystemExit(f"Model version {version} not found in {MODELS}.")
+    return joblib.load(path)
+
+
+def predict(model, rfm, project=False):
+    """
+    user_id, cluster and segment for the rfm rows with usable features;
+    with project, also their PCA coordinates as pca1 and pca2.
+    """
+    X = features.clustering_matrix(rfm)
+    X_scaled = model["scaler"].transform(X)
+    q1, q2 = model["thresholds"]
+    scored = rfm.loc[X.index, ["user_id"]].copy()
+    scored["cluster"] = model["kmeans"].predict(X_scaled)
+    scored["segment"] = features.segment(rfm.loc[X.index, "recency"], q1, q2)
+    if project:
+        p2 = model["pca"].transform(X_scaled)
+        scored["pca1"], scored["pca2"] = p2[:, 0], p2[:, 1]
+    return scored
+
+
+def prepare(cur):
+    """Create user_segments and score_progress if needed, and the temp table write() copies through."""
+    cur.execute(SEGMENTS_TABLE)
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS score_batch (
+            user_id BIGINT, cluster SMALLINT, segment TEXT, model_version TEXT
+        ) ON COMMIT DROP;
+    """)
+
+
+def write(cur, scored, version):
+    """Upsert one batch of scores through COPY into the temp table."""
+    buf = io.StringIO()
+    scored[["user_id", "cluster", "segment"]].assign(model_version=version).to_csv(
+        buf, index=False, header=False)
+    buf.seek(0)
+    cur.execute("TRUNCATE score_batch;")
+    cur.copy_expert("COPY score_batch FROM STDIN WITH (FORMAT csv)", buf)
+    cur.execute("""
+        INSERT INTO user_segments (user_id, cluster, segment, model_version)
+        SELECT user_id, cluster, segment, model_version FROM score_batch
+        ON CONFLICT (user_id) DO UPDATE SET
+            cluster = EXCLUDED.cluster,
+            segment = EXCLUDED.segment,
+            model_version = EXCLUDED.model_version,
+            scored_at = now();
+    """)
+
+
+def scored_through(cur, version):
+    """The newest user_rfm.updated_at already scored with this version, or None."""
+    cur.execute("SELECT scored_through FROM score_progress WHERE model_version = %s;", (version,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def mark_scored(cur, version, through):
+    """Record that every user_rfm row updated up to through is scored with this version."""
+    cur.execute("""
+        INSERT INTO score_progress (model_version, scored_through) VALUES (%s, %s)
+        ON CONFLICT (model_version) DO UPDATE SET
+            scored_through = greatest(score_progress.scored_through, EXCLUDED.scored_through);
+    """, (version, through))
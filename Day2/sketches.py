@@ -0,0 +1,324 @@
+"""
+Mergeable quantile sketches of the purchase prices.
+
+KLL keeps a few hundred weighted samples of a stream, whatever its
+length, and answers any quantile within about 1% of rank; two sketches
+merge into the sketch of both streams. One sketch per month of
+purchase prices is built in a single streaming pass and stored in
+price_sketches with the load marks (Day0/ex02/load_marks.sql) of the
+tables its rows came from, so a boxplot of any range of months merges a few
+stored sketches instead of reading rows. count, mean, std, min and max
+are kept exactly alongside.
+
+    python sketches.py              # sketch the months that are new or reloaded
+    python sketches.py --rebuild    # sketch every month again
+"""
+import argparse
+import io
+import itertools
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+
+K = 400
+BATCH = 100_000
+
+SKETCH_TABLE = """
+CREATE TABLE IF NOT EXISTS price_sketches (
+    month DATE PRIMARY KEY,
+    load_id BIGINT,
+    n BIGINT NOT NULL,
+    sketch BYTEA NOT NULL
+);
+"""
+
+LOAD_MARKS_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "..", "Day0", "ex02", "load_marks.sql")
+
+# the tables customers reads rows from (itself, or its partitions) and their load marks
+RELATIONS = "SELECT rel::text, load_id FROM customers_loads();"
+
+_HEADER = struct.Struct("<iqddddi")
+_cursors = itertools.count()
+
+
+class KLL:
+    """KLL quantile sketch over floats, with exact count, moments and range."""
+
+    def __init__(self, k=K, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _moments(self, n, mean, m2, lo, hi):
+        # Chan et al. pairwise update, so merged variances stay exact
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    def _compress(self):
+        while True:
+            over = [h for h, level in enumerate(self.levels) if len(level) >= self._capacity(h)]
+            if not over:
+                return
+            h = over[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            level = np.sort(self.levels[h])
+            # an odd item stays behind; every other item of the rest moves up with double weight
+            keep = level[-1:] if len(level) % 2 else level[:0]
+            pairs = level[:len(level) - len(keep)]
+            promoted = pairs[self._rng.integers(2)::2]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+
+    def update(self, values):
+        """Add a batch of values (NaN ignored)."""
+        v = np.asarray(values, dtype=float)
+        v = v[~np.isnan(v)]
+        if len(v):
+            mean = v.mean()
+            self._moments(len(v), mean, float(((v - mean) ** 2).sum()), v.min(), v.max())
+            self.levels[0] = np.concatenate([self.levels[0], v])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        if other.n:
+            self._moments(other.n, other.mean, other.m2, other.min, other.max)
+            while len(self.levels) < len(other.levels):
+                self.levels.append(np.empty(0))
+            for h, level in enumerate(other.levels):
+                self.levels[h] = np.concatenate([self.levels[h], level])
+            self._compress()
+        return self
+
+    def quantiles(self, qs):
+        """Approximate quantiles; 0 and 1 give the exact min and max, NaN when empty."""
+        if not self.n:
+            return np.full(len(np.atleast_1d(qs)), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h)
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cum = items[order], np.cumsum(weights[order])
+        out = []
+        for q in np.atleast_1d(qs):
+            if q <= 0:
+                out.append(self.min)
+            elif q >= 1:
+                out.append(self.max)
+            else:
+                i = min(np.searchsorted(cum, q * cum[-1]), len(items) - 1)
+                out.append(items[i])
+        return np.asarray(out, dtype=float)
+
+    def retained(self):
+        """The weighted samples the sketch keeps, sorted."""
+        return np.sort(np.concatenate(self.levels))
+
+    def to_bytes(self):
+        buf = io.BytesIO()
+        buf.write(_HEADER.pack(self.k, self.n, self.mean, self.m2, self.min, self.max,
+                               len(self.levels)))
+        buf.write(np.array([len(level) for level in self.levels], dtype="<i8").tobytes())
+        for level in self.levels:
+            buf.write(level.astype("<f8").tobytes())
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        k, n, mean, m2, lo, hi, nlevels = _HEADER.unpack_from(data)
+        sketch = cls(k)
+        sketch.n, sketch.mean, sketch.m2, sketch.min, sketch.max = n, mean, m2, lo, hi
+        offset = _HEADER.size
+        sizes = np.frombuffer(data, dtype="<i8", count=nlevels, offset=offset)
+        offset += 8 * nlevels
+        sketch.levels = []
+        for size in sizes:
+            sketch.levels.append(np.frombuffer(data, dtype="<f8", count=int(size), offset=offset).copy())
+            offset += 8 * int(size)
+        return sketch
+
+
+def describe(sketch):
+    """
+    The numbers of Series.describe() from a sketch; quartiles approximate.
+    Like describe() of an empty Series, an empty sketch gives count 0 and NaN.
+    """
+    q1, med, q3 = sketch.quantiles([0.25, 0.5, 0.75])
+    std = np.sqrt(sketch.m2 / (sketch.n - 1)) if sketch.n > 1 else np.nan
+    lo, hi, mean = (sketch.min, sketch.max, sketch.mean) if sketch.n else (np.nan,) * 3
+    return pd.Series({
+        "count": float(sketch.n), "mean": mean, "std": std, "min": lo,
+        "25%": q1, "50%": med, "75%": q3, "max": hi,
+    })
+
+
+def box_stats(sketch):
+    """
+    Axes.bxp stats from a sketch: quartiles from the sketch, whiskers at
+    the retained samples nearest inside 1.5 IQR (the exact min or max
+    when nothing lies beyond), and the retained samples outside as fliers.
+    """
+    if not sketch.n:
+        raise SystemExit("No purchase data found in customers table.")
+    q1, med, q3 = sketch.quantiles([0.25, 0.5, 0.75])
+    low_fence, high_fence = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    samples = sketch.retained()
+    inside = samples[(samples >= low_fence) & (samples <= high_fence)]
+    fliers = np.unique(samples[(samples < low_fence) | (samples > high_fence)])
+    whislo = sketch.min if sketch.min >= low_fence else (inside.min() if len(inside) else q1)
+    whishi = sketch.max if sketch.max <= high_fence else (inside.max() if len(inside) else q3)
+    if sketch.min < low_fence:
+        fliers = np.union1d(fliers, [sketch.min])
+    if sketch.max > high_fence:
+        fliers = np.union1d(fliers, [sketch.max])
+    return {"med": med, "q1": q1, "q3": q3, "whislo": whislo, "whishi": whishi, "fliers": fliers}
+
+
+def stream(sql, batch=BATCH):
+    """Column v of sql as float arrays of at most batch values, from a server-side cursor."""
+    conn = db.engine().raw_connection()
+    try:
+        cur = conn.cursor(name=f"sketch_stream_{next(_cursors)}")
+        cur.itersize = batch
+        cur.execute(sql)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            yield np.array(rows, dtype=float)[:, 0]
+        cur.close()
+    finally:
+        conn.close()
+
+
+def sketch_of(sql, batch=BATCH, k=K):
+    """One streaming pass over column v of sql into a new sketch."""
+    sketch = KLL(k)
+    for values in stream(sql, batch):
+        sketch.update(values)
+    return sketch
+
+
+def _months(conn):
+    """First day of every month that has purchases, in UTC."""
+    lo, hi = conn.exec_driver_sql(
+        f"SELECT min(event_time), max(event_time) FROM {db.CUSTOMERS} "
+        f"WHERE {db.WHERE_PURCHASE};").one()
+    if lo is None:
+        return []
+    return list(pd.period_range(pd.Timestamp(lo).tz_convert("UTC").tz_localize(None),
+                                pd.Timestamp(hi).tz_convert("UTC").tz_localize(None), freq="M"))
+
+
+def _month_where(month):
+    start = month.start_time.strftime("%Y-%m-%d")
+    end = (month + 1).start_time.strftime("%Y-%m-%d")
+    return (f"{db.WHERE_PURCHASE} AND event_time >= '{start} 00:00:00+00' "
+            f"AND event_time < '{end} 00:00:00+00'")
+
+
+def month_loads(conn, months):
+    """
+    {month: newest load_id} over the tables of customers holding rows in
+    each month (None when none of them is marked), their time ranges read
+    through the event_time indexes.
+    """
+    spans = []
+    for table_name, load_id in conn.exec_driver_sql(RELATIONS).all():
+        lo, hi = conn.exec_driver_sql(f"SELECT min(event_time), max(event_time) FROM {table_name};").one()
+        if lo is not None and load_id is not None:
+            spans.append((pd.Timestamp(lo), pd.Timestamp(hi), load_id))
+    loads = {}
+    for month in months:
+        start = month.start_time.tz_localize("UTC")
+        end = (month + 1).start_time.tz_localize("UTC")
+        ids = [load_id for lo, hi, load_id in spans if lo < end and hi >= start]
+        loads[month] = max(ids) if ids else None
+    return loads
+
+
+def refresh(rebuild=False, batch=BATCH, k=K):
+    """
+    Sketch the months with no stored sketch, or where a table holding
+    their rows was loaded again since (its load mark moved); rebuild
+    redoes all. Rows deleted from a month afterwards need a rebuild.
+    """
+    with db.engine().begin() as conn:
+        with open(LOAD_MARKS_SQL) as f:
+            conn.exec_driver_sql(f.read())
+        conn.exec_driver_sql(SKETCH_TABLE)
+        stored = dict(conn.exec_driver_sql("SELECT month, load_id FROM price_sketches;").all())
+        # marks read before the rows: a load landing in between is redone next time
+        loads = month_loads(conn, _months(conn))
+        todo = [(month, load_id) for month, load_id in loads.items()
+                if rebuild or month.start_time.date() not in stored
+                or stored[month.start_time.date()] != load_id]
+
+    for month, load_id in todo:
+        start = time.perf_counter()
+        sketch = sketch_of(f"SELECT event_price::float8 FROM {db.CUSTOMERS} "
+                           f"WHERE {_month_where(month)};", batch, k)
+        with db.engine().begin() as conn:
+            conn.exec_driver_sql("""
+                INSERT INTO price_sketches (month, load_id, n, sketch)
+                VALUES (%(month)s, %(load_id)s, %(n)s, %(sketch)s)
+                ON CONFLICT (month) DO UPDATE SET
+                    load_id = EXCLUDED.load_id, n = EXCLUDED.n, sketch = EXCLUDED.sketch;
+            """, {"month": month.start_time.date(), "load_id": load_id,
+                  "n": sketch.n, "sketch": sketch.to_bytes()})
+        print(f"[sketch] {month}: {sketch.n:,} prices in {time.perf_counter() - start:.1f}s")
+    return len(todo)
+
+
+def load(lo=db.WINDOW[0], hi=db.WINDOW[1]):
+    """
+    The merged sketch of the stored months starting in [lo, hi); empty
+    before the first refresh(), which creates price_sketches.
+    """
+    merged = KLL()
+    with db.engine().connect() as conn:
+        if conn.exec_driver_sql("SELECT to_regclass('price_sketches');").scalar() is None:
+            return merged
+        rows = conn.exec_driver_sql(
+            "SELECT sketch FROM price_sketches WHERE month >= %(lo)s AND month < %(hi)s "
+            "ORDER BY month;", {"lo": lo, "hi": hi}).all()
+    for (data,) in rows:
+        merged.merge(KLL.from_bytes(data))
+    return merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the monthly price sketches")
+    parser.add_argument("--rebuild", action="store_true", help="sketch every month again")
+    parser.add_argument("--batch", type=int, default=BATCH, help="prices fetched per batch")
+    parser.add_argument("-k", type=int, default=K, help="sketch size parameter")
+    args = parser.parse_args()
+    built = refresh(rebuild=args.rebuild, batch=args.batch, k=args.k)
+    print(f"[✔] {built} month(s) sketched")
+    merged = load()
+    if not merged.n:
+        raise SystemExit("No purchase data found in customers table.")
+    print(describe(merged))
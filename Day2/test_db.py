@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import db
+import result_cache
+
+# purchases seeded by the test, whatever layout customers has
+TABLE = "test_db_purchases"
+
+SEED = f"""
+DROP TABLE IF EXISTS {TABLE};
+CREATE TABLE {TABLE} AS
+SELECT timestamptz '2022-10-01 00:00:00+00' + g * interval '1 hour' AS event_time,
+       'purchase'::varchar(20) AS event_type,
+       -- a few far outliers for the whiskers to leave out
+       (CASE WHEN g %% 100 = 0 THEN 500 ELSE g %% 37 END)::numeric(10,2) AS event_price,
+       g::bigint AS user_id
+FROM generate_series(1, 2000) g;
+"""
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE", str(tmp_path))
+    monkeypatch.setattr(result_cache, "MAX_BYTES", 2 ** 30)
+    # the table list is read once per process, before the seed table exists
+    monkeypatch.setattr(result_cache, "_relations", None)
+    try:
+        with db.engine().connect() as conn:
+            conn.exec_driver_sql("SELECT 1;")
+    except Exception as e:
+        pytest.skip(f"Postgres not reachable: {e}")
+    with db.engine().begin() as conn:
+        conn.exec_driver_sql(SEED, {})
+    monkeypatch.setattr(db, "CUSTOMERS", TABLE)
+    yield tmp_path
+    with db.engine().begin() as conn:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {TABLE};")
+
+
+def test_box_stats_served_from_the_cache(cache):
+    values = db.windowed_purchases("event_price::float8 AS v")
+    first_desc, first = db.box_stats(values)
+    assert first_desc["count"] == 2000
+    assert (first["fliers"] == 500).all()
+    assert list(cache.glob("*.parquet"))
+    second_desc, second = db.box_stats(values)
+    assert second_desc.equals(first_desc)
+    assert np.array_equal(second["fliers"], first["fliers"])
+    assert second["fliers"].dtype == float
@@ -0,0 +1,51 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.colors import to_rgb
+
+import density
+
+
+def test_small_scatter_draws_markers():
+    fig, ax = plt.subplots()
+    x = np.arange(10.0)
+    assert not density.scatter(ax, x, x, threshold=100)
+    assert not ax.images
+    assert len(ax.collections[0].get_offsets()) == 10
+    plt.close(fig)
+
+
+def test_image_mixes_the_colors_of_each_cell():
+    fig, ax = plt.subplots()
+    # group 0 alone at the bottom left, group 1 alone at the top right,
+    # both in equal numbers in the middle
+    x = np.array([0.0, 0.5, 0.5, 1.0])
+    y = np.array([0.0, 0.5, 0.5, 1.0])
+    group = np.array([0, 0, 1, 1])
+    colors = {0: "blue", 1: "red"}
+    assert density.scatter(ax, x, y, group, colors, {0: "Sith", 1: "Jedi"}, threshold=0)
+    rgba = ax.images[0].get_array()
+    assert rgba.shape == (density.GRID[1], density.GRID[0], 4)
+    filled = rgba[..., 3] > 0
+    assert filled.sum() == 3
+    assert np.allclose(rgba[0, 0, :3], to_rgb("blue"))
+    assert np.allclose(rgba[-1, -1, :3], to_rgb("red"))
+    middle = rgba[density.GRID[1] // 2, density.GRID[0] // 2]
+    assert np.allclose(middle[:3], (np.array(to_rgb("blue")) + to_rgb("red")) / 2)
+    # the doubled middle cell is the most opaque
+    assert middle[3] == rgba[..., 3].max() == 1.0
+    assert [t.get_text() for t in ax.legend().get_texts()] == ["Sith", "Jedi"]
+    plt.close(fig)
+
+
+def test_image_drops_non_finite_points_and_handles_a_single_value():
+    fig, ax = plt.subplots()
+    x = np.array([2.0, 2.0, np.nan, np.inf])
+    density.image(ax, x, np.ones(4), np.zeros(4), {0: "gray"})
+    rgba = ax.images[0].get_array()
+    assert (rgba[..., 3] > 0).sum() == 1
+    assert ax.images[0].get_extent() == [1.5, 2.5, 0.5, 1.5]
+    plt.close(fig)
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+import dtypes
+
+
+def cents(lo, hi):
+    return pd.Series(np.arange(lo, hi) / 100, name="event_price")
+
+
+def test_prices_round_trip_below_the_limit():
+    limit = int(dtypes.PRICE_LIMIT * 100)
+    prices = cents(limit - 500_000, limit)
+    small = dtypes.compact(prices.to_frame())
+    assert small["event_price"].dtype == "float32"
+    assert (dtypes.exact_prices(small)["event_price"] == prices).all()
+
+
+def test_prices_above_the_limit_stay_float64():
+    prices = cents(13_107_200, 13_107_300)          # 131072.00 → 131072.99
+    assert dtypes.compact(prices.to_frame())["event_price"].dtype == "float64"
+
+
+def test_prices_that_do_not_round_trip_stay_float64():
+    prices = pd.Series([1.5, 2.123456789], name="event_price")
+    assert dtypes.compact(prices.to_frame())["event_price"].dtype == "float64"
+
+
+def test_uuid_bytes_round_trip():
+    values = pd.Series(["00000000-0000-0000-370b-0f194ba92900", None,
+                        "123e4567-e89b-12d3-a456-426614174000"], name="user_session")
+    packed = dtypes.uuid_bytes(values)
+    assert packed.memory_usage(deep=True, index=False) < 64
+    assert dtypes.uuid_text(packed).tolist() == [values[0], None, values[2]]
@@ -0,0 +1,28 @@
+import os
+
+import numpy as np
+
+import kmeans_engine
+
+
+def test_cached_fit_predicts_like_the_fresh_one(tmp_path, monkeypatch):
+    monkeypatch.setattr(kmeans_engine, "CACHE", str(tmp_path))
+    X = np.random.default_rng(0).normal(size=(2_000, 3))
+    fresh = kmeans_engine.fit(X, 4)
+    cached = kmeans_engine.fit(X, 4)
+    assert np.array_equal(cached.cluster_centers_, fresh.cluster_centers_)
+    assert np.array_equal(cached.predict(X), fresh.predict(X))
+    assert cached.inertia_ == fresh.inertia_
+    # the entry holds the centroids, not the model and its labels
+    entry = kmeans_engine.joblib.load(os.path.join(tmp_path, os.listdir(tmp_path)[0]))
+    assert set(entry) == {"centers", "inertia"}
+
+
+def test_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(kmeans_engine, "CACHE", str(tmp_path))
+    X = np.random.default_rng(0).normal(size=(500, 2))
+    kmeans_engine.sweep(X, range(1, 6), workers=1)
+    size = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    monkeypatch.setattr(kmeans_engine, "MAX_BYTES", size // 2)
+    kmeans_engine.sweep(X, range(6, 8), workers=1)
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= size // 2
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import sketches
+
+
+def test_empty_sketch():
+    empty = sketches.KLL()
+    assert np.isnan(empty.quantiles([0.25, 0.5, 0.75])).all()
+    desc = sketches.describe(empty)
+    assert desc["count"] == 0
+    assert desc.drop("count").isna().all()
+    with pytest.raises(SystemExit):
+        sketches.box_stats(empty)
+    assert sketches.KLL.from_bytes(empty.to_bytes()).n == 0
+
+
+def test_merge_matches_one_sketch_of_both():
+    rng = np.random.default_rng(0)
+    a, b = rng.lognormal(size=200_000), rng.normal(50, 5, size=100_000)
+    merged = sketches.KLL().update(a).merge(sketches.KLL().update(b))
+    both = np.concatenate([a, b])
+    assert merged.n == len(both)
+    assert merged.mean == pytest.approx(both.mean())
+    assert np.sqrt(merged.m2 / (merged.n - 1)) == pytest.approx(both.std(ddof=1))
+    assert (merged.min, merged.max) == (both.min(), both.max())
+    # within 1% of rank
+    for q, value in zip([0.1, 0.25, 0.5, 0.75, 0.9], merged.quantiles([0.1, 0.25, 0.5, 0.75, 0.9])):
+        assert abs((both <= value).mean() - q) < 0.01
+    # merging an empty sketch changes nothing
+    assert merged.merge(sketches.KLL()).n == len(both)
+
+
+def test_serialize_round_trip():
+    sketch = sketches.KLL(k=50).update(np.random.default_rng(1).uniform(size=10_000))
+    back = sketches.KLL.from_bytes(sketch.to_bytes())
+    assert (back.k, back.n, back.mean, back.m2, back.min, back.max) == \
+        (sketch.k, sketch.n, sketch.mean, sketch.m2, sketch.min, sketch.max)
+    assert np.array_equal(back.retained(), sketch.retained())
+    assert np.array_equal(back.quantiles([0.1, 0.5, 0.9]), sketch.quantiles([0.1, 0.5, 0.9]))
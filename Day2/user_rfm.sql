@@ -0,0 +1,104 @@
+-- Per-user purchase features for elbow.py and Clustering.py, kept in a
+-- table instead of being rebuilt from every purchase on each run.
+-- user_rfm holds last purchase time, purchase count and total spend.
+-- refresh_user_rfm() finds the tables of customers loaded since its
+-- last run from their load marks (Day0/ex02/load_marks.sql): a new
+-- month, a reloaded one, or an older month attached late. Only the
+-- buyers found in those tables are recomputed, over all their purchases
+-- in customers, and upserted.
+-- Run after the load and dedup steps: rows deleted from customers
+-- later, or a user's last purchases leaving a reloaded table, are not
+-- taken back out; SELECT rebuild_user_rfm() starts over.
+-- updated_at marks the users a refresh changed, so ex05/score.py can
+-- re-segment just those: refreshes run one at a time and stamp their
+-- rows once they hold the lock, so a refresh still running always
+-- stamps later than any that committed before it.
+-- Run: SELECT refresh_user_rfm();
+
+\ir ../Day0/ex02/load_marks.sql
+
+CREATE TABLE IF NOT EXISTS user_rfm (
+    user_id BIGINT PRIMARY KEY,
+    last_purchase TIMESTAMPTZ NOT NULL,
+    purchase_count BIGINT NOT NULL,
+    total_spent NUMERIC(14,2) NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS user_rfm_updated_idx ON user_rfm (updated_at);
+
+-- each relation of customers as last folded in: its load_id then
+CREATE TABLE IF NOT EXISTS user_rfm_loads (
+    table_name TEXT PRIMARY KEY,
+    load_id BIGINT
+);
+
+CREATE OR REPLACE FUNCTION refresh_user_rfm()
+RETURNS bigint AS $$
+DECLARE
+    r record;
+    touched bigint;
+    stamp timestamptz;
+BEGIN
+    -- one refresh at a time; now() would be the transaction's start,
+    -- possibly before an earlier refresh committed
+    LOCK TABLE user_rfm_loads IN SHARE ROW EXCLUSIVE MODE;
+    stamp := clock_timestamp();
+
+    -- the marks as of now: a load committing during the run is redone next time
+    DROP TABLE IF EXISTS user_rfm_current;
+    CREATE TEMP TABLE user_rfm_current AS SELECT * FROM customers_loads();
+
+    DROP TABLE IF EXISTS user_rfm_buyers;
+    CREATE TEMP TABLE user_rfm_buyers (user_id BIGINT);
+    FOR r IN
+        SELECT n.rel
+        FROM user_rfm_current n
+        LEFT JOIN user_rfm_loads o ON o.table_name = n.rel::text
+        WHERE o.table_name IS NULL OR o.load_id IS DISTINCT FROM n.load_id
+    LOOP
+        RAISE NOTICE 'user_rfm: % was loaded since the last run', r.rel;
+        EXECUTE format(
+            'INSERT INTO user_rfm_buyers SELECT DISTINCT user_id FROM %s WHERE event_type = %L AND user_id IS NOT NULL',
+            r.rel, 'purchase');
+    END LOOP;
+    ANALYZE user_rfm_buyers;
+
+    -- whole totals, not increments: a reloaded month is not counted twice
+    EXECUTE format($q$
+        INSERT INTO user_rfm AS r (user_id, last_purchase, purchase_count, total_spent, updated_at)
+        SELECT user_id, max(event_time), count(*), coalesce(sum(%1$I), 0), $1
+        FROM customers
+        WHERE event_type = 'purchase'
+          AND user_id IN (SELECT user_id FROM user_rfm_buyers)
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            last_purchase = EXCLUDED.last_purchase,
+            purchase_count = EXCLUDED.purchase_count,
+            total_spent = EXCLUDED.total_spent,
+            updated_at = EXCLUDED.updated_at
+        WHERE (r.last_purchase, r.purchase_count, r.total_spent)
+              IS DISTINCT FROM (EXCLUDED.last_purchase, EXCLUDED.purchase_count, EXCLUDED.total_spent)
+    $q$, customers_price_col()) USING stamp;
+    GET DIAGNOSTICS touched = ROW_COUNT;
+
+    -- the loads marked so far are accounted for
+    DELETE FROM user_rfm_loads;
+    INSERT INTO user_rfm_loads SELECT rel::text, load_id FROM user_rfm_current;
+    DROP TABLE user_rfm_current;
+    DROP TABLE user_rfm_buyers;
+    ANALYZE user_rfm;
+    RETURN touched;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rebuild_user_rfm()
+RETURNS bigint AS $$
+BEGIN
+    TRUNCATE user_rfm;
+    DELETE FROM user_rfm_loads;
+    RETURN refresh_user_rfm();
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_user_rfm() AS users_updated;
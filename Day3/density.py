@@ -0,0 +1,44 @@
+"""
+Knight scatter plots that stay fast with millions of rows.
+
+Above THRESHOLD rows, knights() draws the scatter as a density image
+instead of one marker per knight, with the raster of Day2/density.py:
+each group (Jedi, Sith, or all knights) is binned on one shared grid,
+and every cell takes the count-weighted mix of its groups' colors.
+DENSITY_THRESHOLD sets the threshold (default 100000 rows); below it
+the ex scripts draw their usual seaborn plot.
+"""
+import importlib.util
+import os
+
+import numpy as np
+
+# Day2/density.py, loaded under its own name: this module is density too
+_spec = importlib.util.spec_from_file_location(
+	"day2_density", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Day2", "density.py"))
+_raster = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_raster)
+
+THRESHOLD = _raster.THRESHOLD
+
+KNIGHT_COLORS = {0: "blue", 1: "red"}
+KNIGHT_LABELS = {0: "Sith", 1: "Jedi"}
+
+
+def knights(ax, df, x_col, y_col, colored=True):
+	"""
+	Density version of the ex scatter plots: Jedi vs Sith when colored and
+	df has a 0/1 knight column, all knights in gray otherwise, with the
+	same legend and axis labels. Returns the legend text for the title.
+	"""
+	if colored and "knight" in df.columns:
+		_raster.image(ax, df[x_col], df[y_col], df["knight"], KNIGHT_COLORS, KNIGHT_LABELS, alpha=0.6)
+		ax.legend(title="Knight", loc="upper right")
+		text = "(Jedi vs Sith)"
+	else:
+		_raster.image(ax, df[x_col], df[y_col], np.zeros(len(df)), {0: "gray"}, {0: "Knight"}, alpha=0.6)
+		ax.legend(title="Group", loc="upper right")
+		text = "(All Knights)"
+	ax.set_xlabel(x_col)
+	ax.set_ylabel(y_col)
+	return text
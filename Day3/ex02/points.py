@@ -2,6 +2,10 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import density
 
 
 def scatter_plot(csv_path, x_col, y_col, output_name, colored=False):
@@ -10,11 +14,16 @@ def scatter_plot(csv_path, x_col, y_col, output_name, colored=False):
 	df.columns = df.columns.str.strip().str.lower()
 
 	plt.figure(figsize=(7, 5))
+	large = len(df) > density.THRESHOLD
 
 	if colored and "knight" in df.columns:
 		# Jedi vs Sith
 		if df["knight"].dtype == object:
 			df["knight"] = df["knight"].map({"Jedi": 1, "Sith": 0})
+	if large:
+		# Too many knights for one marker each: density image instead
+		legend_text = density.knights(plt.gca(), df, x_col, y_col, colored)
+	elif colored and "knight" in df.columns:
 		sns.scatterplot(
 			data=df,
 			x=x_col,
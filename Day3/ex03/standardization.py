@@ -1,8 +1,13 @@
+import os
+import sys
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from sklearn.preprocessing import StandardScaler
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import density
+
 # === Change this line only when testing ===
 FILENAME = "Test_knight.csv"
 
@@ -36,7 +41,10 @@ def standardize_and_plot(csv_path):
 	x_col, y_col = "strength", "empowered"
 
 	plt.figure(figsize=(7, 5))
-	if "knight" in df_std.columns:
+	if len(df_std) > density.THRESHOLD:
+		# Too many knights for one marker each: density image instead
+		density.knights(plt.gca(), df_std, x_col, y_col)
+	elif "knight" in df_std.columns:
 		sns.scatterplot(
 			data=df_std,
 			x=x_col,
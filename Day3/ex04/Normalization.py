@@ -1,8 +1,13 @@
+import os
+import sys
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from sklearn.preprocessing import MinMaxScaler
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import density
+
 # === Change this line to test the other dataset ===
 # FILENAME = "Train_knight.csv"
 FILENAME = "Train_knight.csv"
@@ -37,7 +42,10 @@ def normalize_and_plot(csv_path):
 	x_col, y_col = "strength", "empowered"
 
 	plt.figure(figsize=(7, 5))
-	if "knight" in df_norm.columns:
+	if len(df_norm) > density.THRESHOLD:
+		# Too many knights for one marker each: density image instead
+		density.knights(plt.gca(), df_norm, x_col, y_col)
+	elif "knight" in df_norm.columns:
 		# Jedi vs Sith
 		sns.scatterplot(
 			data=df_norm,